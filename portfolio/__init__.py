@@ -0,0 +1,6 @@
+'''
+Shared building blocks for the portfolio scripts under sandbox/.
+
+The scripts are run from their own directories, so they put the
+repository root on sys.path before importing from this package.
+'''
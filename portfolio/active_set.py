@@ -0,0 +1,272 @@
+'''
+Active-set solver for the min-variance problems of the sweeps.
+
+Every min-variance problem in the scripts and notebooks has the form
+
+    minimize    x' Sigma x + tau * ||x||_1
+    subject to  1' x == 1
+                r_hat' x >= floor
+                x >= 0                      (long-only problems)
+
+a quadratic objective, a budget equality, one return inequality and
+bounds.  Going through cvxpy costs tens of milliseconds per solve, almost
+all of it canonicalisation and interior-point set-up, for a solution that
+typically holds only 10 - 60 assets.  ActiveSetProblem solves it directly
+with a primal active-set method: starting from the single asset with the
+largest return (a vertex of the feasible set), it adds the asset whose
+bound multiplier is most negative, takes the Newton step of the
+equality-constrained QP on the free assets and shortens it when a weight
+reaches zero or the return floor is reached.  Each iteration is a
+(K + 2)-by-(K + 2) linear solve over the K free assets, and a solve from
+scratch takes two or three iterations per asset of the solution.
+
+Shorts are handled by splitting x = u - v with u, v >= 0, which turns the
+l1 penalty into the linear term tau * 1' (u + v).  Column k < N of the
+split problem is u_k and column N + k is v_k; for long-only problems only
+the first N columns exist, and the penalty is the constant tau.
+
+Successive solves are warm started from the previous active set, so a
+tau sweep only takes the few steps between neighbouring solutions.
+
+It has the set_data() / solve() interface of min_variance.MinVarianceProblem,
+so minimize_var() can use either.
+
+Usage:
+    problem = ActiveSetProblem(N)
+    problem.set_data(r_hat, sigma, equal_weight_return)
+    for tau in taus:
+        (optimal_value, optimal_x) = problem.solve(tau)
+'''
+
+import numpy as np
+
+from portfolio.factor_model import FactorCovariance
+
+
+class ActiveSetProblem(object):
+    '''
+    The min-variance problem of minimize_var(), solved by an active-set method
+
+    Args:
+        N: number of assets
+        long_only: whether the weights are constrained to x >= 0
+        tol: optimality tolerance on the multipliers, relative to the
+             largest entry of the gradient
+        max_iter: the solve is abandoned (ValueError) after this many
+                  iterations, defaults to 10 * N
+    '''
+
+    def __init__(self, N, long_only = False, tol = 1e-10, max_iter = None):
+        self.N = N
+        self.long_only = long_only
+        self.tol = tol
+        self.max_iter = 10 * N if max_iter is None else max_iter
+        self.sigma = None
+        self.Q = None
+        self.r_hat = None
+        self.floor = None
+        self.free = None
+        self.binds = False
+
+    def set_data(self, r_hat, sigma, floor):
+        '''
+        Load one training window; the warm start is kept when only sigma is unchanged
+
+        Args:
+            r_hat: estimated returns as a N-by-1 matrix
+            sigma: estimated covariance as a N-by-N matrix or a FactorCovariance
+            floor: the minimum return of the portfolio
+        '''
+        r_hat = np.asarray(r_hat, dtype = np.float64).reshape(self.N)
+        floor = float(floor)
+        if sigma is not self.sigma:
+            self.Q = sigma.dense() if isinstance(sigma, FactorCovariance) else np.asarray(sigma, dtype = np.float64)
+            self.sigma = sigma
+            self.free = None
+        if self.r_hat is None or floor != self.floor or not np.array_equal(r_hat, self.r_hat):
+            self.free = None
+        self.r_hat = r_hat
+        self.floor = floor
+
+    def columns(self, free):
+        '''
+        Get the asset and sign of columns of the split problem
+
+        Returns:
+            tuple of the asset index and the sign (+1 for u, -1 for v) of each column
+        '''
+        free = np.asarray(free, dtype = int)
+        return(free % self.N, np.where(free < self.N, 1.0, -1.0))
+
+    def weights(self, free, z):
+        '''
+        Get the weights x = u - v from the values z of the free columns
+        '''
+        (assets, signs) = self.columns(free)
+        x = np.zeros(self.N)
+        np.add.at(x, assets, signs * z)
+        return(x)
+
+    def start(self):
+        '''
+        Get a feasible starting point: all in the asset with the largest return
+
+        Returns:
+            tuple of the free columns, their values and whether the floor binds
+        '''
+        k = int(np.argmax(self.r_hat))
+        if self.r_hat[k] < self.floor:
+            raise ValueError('no portfolio reaches the return floor %g (largest return %g)'
+                             % (self.floor, self.r_hat[k]))
+        return([k], np.ones(1), self.r_hat[k] - self.floor <= self.tol * max(abs(self.floor), 1.0))
+
+    def warm_start(self):
+        '''
+        Get the starting point from the previous solve if there is one
+
+        Returns:
+            tuple of the free columns, their values and whether the floor binds
+        '''
+        if self.free is None:
+            return(self.start())
+        return(list(self.free), self.z.copy(), self.binds)
+
+    def kkt(self, free, binds, g):
+        '''
+        Solve the equality-constrained QP on the free columns for the step
+        and the multipliers
+
+        Args:
+            free: the free columns
+            binds: whether the return floor is in the working set
+            g: gradient of the objective on the free columns
+
+        Returns:
+            tuple of the step on the free columns, the budget multiplier and
+            the floor multiplier (0 if the floor is not in the working set);
+            the multipliers are those at the end of the step, None when the
+            step is a direction of zero curvature rather than a Newton step
+        '''
+        (assets, signs) = self.columns(free)
+        K = len(free)
+        m = 2 if binds else 1
+        M = np.zeros((K + m, K + m))
+        M[:K, :K] = 2 * self.Q[np.ix_(assets, assets)] * np.outer(signs, signs)
+        M[:K, K] = -signs
+        M[K, :K] = signs
+        if binds:
+            M[:K, K + 1] = -signs * self.r_hat[assets]
+            M[K + 1, :K] = signs * self.r_hat[assets]
+        rhs = np.zeros(K + m)
+        rhs[:K] = -g
+        try:
+            sol = np.linalg.solve(M, rhs)
+        except np.linalg.LinAlgError:
+            sol = None
+        # a (numerically) singular M shows up as a solution of size ~ 1 / eps
+        if sol is None or not (np.abs(sol).max() * np.abs(M).max() <= 1e10 * max(np.abs(rhs).max(), 1e-300)):
+            # the reduced Hessian is singular on the working set, e.g. more
+            # free assets than the rank of a sample covariance: if the
+            # objective is linear and decreasing along a feasible direction,
+            # follow it until a bound stops it, else take the least-squares step
+            (U, sv, Vt) = np.linalg.svd(M[:, :K])
+            null = Vt[sv <= 1e-10 * sv[0]]
+            d = -np.dot(null.T, np.dot(null, g))
+            if np.abs(d).max() > 1e-12 * max(np.abs(g).max(), 1e-300):
+                return(d / np.abs(d).max(), None, None)
+            sol = np.linalg.lstsq(M, rhs, rcond = 1e-10)[0]
+        return(sol[:K], sol[K], sol[K + 1] if binds else 0.0)
+
+    def solve(self, tau):
+        '''
+        Solve for one tau, warm started from the previous solution
+
+        Returns:
+            tuple of the optimal value and the optimal weights as a length N vector
+        '''
+        n = self.N if self.long_only else 2 * self.N
+        (free, z, binds) = self.warm_start()
+        r_all = np.concatenate((self.r_hat, -self.r_hat))[:n]
+        ones = np.concatenate((np.ones(self.N), -np.ones(self.N)))[:n]
+        multipliers = None
+        for it in range(self.max_iter):
+            # x is sparse: Q x only needs the rows (Q is symmetric) of the free assets
+            (assets, signs) = self.columns(free)
+            Qx = 2 * np.dot(signs * z, self.Q[assets])
+            grad = np.concatenate((Qx, -Qx))[:n] + tau
+            scale = max(np.abs(grad).max(), 1.0)
+            if multipliers is None:
+                (p, lam, nu) = self.kkt(free, binds, grad[free])
+                if lam is not None and np.abs(p).max() <= 1e-12 * max(np.abs(z).max(), 1.0):
+                    multipliers = (lam, nu)
+            if multipliers is not None:
+                # stationary on the working set: check the multipliers
+                (lam, nu) = multipliers
+                multipliers = None
+                mult = grad - lam * ones - nu * r_all
+                mult[free] = 0.0
+                k = int(np.argmin(mult))
+                if binds and nu < min(mult[k], 0.0) and nu < -self.tol * scale:
+                    binds = False
+                elif mult[k] < -self.tol * scale:
+                    free.append(k)
+                    z = np.append(z, 0.0)
+                else:
+                    break
+                continue
+            # longest feasible step along p, at most the full Newton step
+            step = 1.0
+            block = None
+            shrinking = p < 0
+            if np.any(shrinking):
+                ratios = -z[shrinking] / p[shrinking]
+                j = int(np.argmin(ratios))
+                if ratios[j] < step:
+                    step = ratios[j]
+                    block = np.flatnonzero(shrinking)[j]
+            if not binds:
+                slope = np.dot(r_all[free], p)
+                if slope < 0:
+                    gap = max(np.dot(r_all[free], z) - self.floor, 0.0)
+                    if gap / -slope < step:
+                        step = gap / -slope
+                        block = 'floor'
+            z = z + step * p
+            if block == 'floor':
+                binds = True
+            elif block is not None:
+                del free[block]
+                z = np.delete(z, block)
+            elif lam is not None:
+                # a full Newton step ends at the minimiser on the working
+                # set, whose multipliers the KKT solve already gave
+                multipliers = (lam, nu)
+        else:
+            raise ValueError('active-set solve did not converge in %d iterations' % self.max_iter)
+        self.free = free
+        self.z = z
+        self.binds = binds
+        x = self.weights(free, z)
+        value = np.dot(x, np.dot(self.Q, x)) + tau * np.abs(x).sum()
+        return(value, x)
+
+
+def min_variance(r_hat, Sigma, tau, mu, long_only = True):
+    '''
+    For a given estimated return floor, get the weights that minimize the
+    variance with an l1 norm of the weights (the notebooks' min_variance())
+
+    Args:
+        r_hat: estimated returns as a n-by-1 matrix
+        Sigma: estimated covariance as a n-by-n matrix or a FactorCovariance
+        tau: tuning parameter. (Larger values promote more sparsity.)
+        mu: the minimum return that the portfolio must beat
+        long_only: whether the weights are constrained to x >= 0
+
+    Returns:
+        optimal weights as a length n vector
+    '''
+    n = np.asarray(r_hat).size
+    problem = ActiveSetProblem(n, long_only = long_only)
+    problem.set_data(r_hat, Sigma, mu)
+    return(problem.solve(tau)[1])
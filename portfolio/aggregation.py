@@ -0,0 +1,173 @@
+'''
+Compounding of returns over periods, geometric means and rolling products.
+
+The bond scripts of sandbox/matthew/ built the yearly gross returns with
+
+    for i in range(1, 31):
+        test = (mon.ix[i*12:i*12+11,:]+1).apply(np.prod, axis=0)
+        rhat = np.vstack([rhat, test])
+
+which copies the growing matrix once per year (quadratic in the number of
+years) and calls np.prod once per column, and post_processing.py went
+through np.vectorize(math.log) and np.vectorize(math.exp) element by
+element.  Here a T-by-N panel is reshaped, as a view, to
+(T / periods)-by-periods-by-N and reduced over the middle axis in one
+pass into a preallocated array, so compounding months into quarters or
+years (and quarters into years) is O(T * N) whatever the period, and
+consecutive aggregations chain:
+
+    quarters = compound(monthly, 3)
+    years = compound(quarters, 4)      # == compound(monthly, 12)
+
+Most functions take gross returns (1 + r), the form the bond scripts
+work in; compound() takes simple returns, like the CSVs.  Every function
+reduces along `axis` (0, the rows, by default), so the post_processing
+layout of months along the rows and years along the columns works as it
+is.
+
+rolling_product() gets the products of all windows of w consecutive rows
+from one prefix and one suffix cumulative product inside blocks of w rows
+(window [i, i + w) is the suffix product of the block i falls in times the
+prefix product of the next one), O(T * N) instead of O(T * N * w) and,
+unlike differences of cumulative log sums, exact for zero or negative
+gross returns.
+
+Usage:
+    gross = compound(mon.values, 12) + 1          # yearly gross returns
+    rhat5 = rolling_geometric_mean(gross, 5)     # rhat5[i]: geometric mean of years i .. i + 4
+    value = net_value(gross)                     # 1, then the cumulative gross return
+'''
+
+import numpy as np
+
+
+def by_period(values, periods, axis = 0):
+    '''
+    Split an axis into consecutive periods
+
+    Args:
+        values: array with a length along axis that is a multiple of periods
+        periods: number of consecutive entries in a period
+        axis: axis to split
+
+    Returns:
+        the array with axis replaced by the two axes (length / periods, periods),
+        a view of values whenever numpy can reshape without copying
+    '''
+    values = np.asarray(values)
+    axis = axis % values.ndim
+    T = values.shape[axis]
+    if periods < 1 or T % periods != 0:
+        raise ValueError('got %d rows, not a whole number of periods of %d' % (T, periods))
+    return(values.reshape(values.shape[:axis] + (T // periods, periods) + values.shape[axis + 1:]))
+
+
+def compound_gross(gross, periods, axis = 0, out = None):
+    '''
+    Compound gross returns over consecutive periods
+
+    Args:
+        gross: gross returns (1 + r), length along axis a multiple of periods
+        periods: number of consecutive entries in a period, e.g. 12 for months to years
+        axis: axis to compound along
+        out: optional preallocated array of the result
+
+    Returns:
+        the gross returns of the periods, length / periods along axis
+        (gross itself if periods is 1)
+    '''
+    if periods == 1 and out is None:
+        return(np.asarray(gross))
+    grouped = by_period(gross, periods, axis)
+    return(np.prod(grouped, axis = (axis % np.ndim(gross)) + 1, out = out))
+
+
+def compound(returns, periods, axis = 0, out = None):
+    '''
+    Compound simple returns over consecutive periods
+
+    Args:
+        returns: simple returns, length along axis a multiple of periods
+        periods: number of consecutive entries in a period
+        axis: axis to compound along
+        out: optional preallocated array of the result
+
+    Returns:
+        the simple returns of the periods, length / periods along axis
+    '''
+    gross = np.add(np.asarray(returns, dtype = np.float64), 1.0)
+    result = compound_gross(gross, periods, axis, out)
+    return(np.subtract(result, 1.0, out = result))
+
+
+def geometric_mean(gross, axis = 0):
+    '''
+    Get the geometric mean of gross returns along an axis, through the mean
+    of their logarithms so long horizons cannot overflow
+
+    Returns:
+        the geometric means, with axis removed
+    '''
+    return(np.exp(np.mean(np.log(gross), axis = axis)))
+
+
+def rolling_product(gross, window, axis = 0):
+    '''
+    Get the products of every window of consecutive entries along an axis
+
+    Args:
+        gross: array of length T along axis
+        window: number of entries in a window, at most T
+        axis: axis to roll along
+
+    Returns:
+        the products, length T - window + 1 along axis, entry i the
+        product of entries i .. i + window - 1
+    '''
+    gross = np.moveaxis(np.asarray(gross, dtype = np.float64), axis, 0)
+    T = gross.shape[0]
+    if window < 1 or window > T:
+        raise ValueError('got a window of %d for %d rows' % (window, T))
+    if window == 1:
+        return(np.moveaxis(gross, 0, axis))
+    # pad to whole blocks with ones, which leave the products unchanged
+    blocks = -(-T // window)
+    padded = np.ones((blocks * window,) + gross.shape[1:])
+    padded[:T] = gross
+    grouped = padded.reshape((blocks, window) + gross.shape[1:])
+    prefix = np.cumprod(grouped, axis = 1).reshape(padded.shape)
+    suffix = np.cumprod(grouped[:, ::-1], axis = 1)[:, ::-1].reshape(padded.shape)
+    # window [i, i + window) = suffix[i] (to the end of i's block) * prefix[i + window - 1]
+    # (from the start of the next block), or the block itself when i starts one
+    products = suffix[:T - window + 1] * prefix[window - 1:T]
+    products[::window] = suffix[:T - window + 1:window]
+    return(np.moveaxis(products, 0, axis))
+
+
+def rolling_geometric_mean(gross, window, axis = 0):
+    '''
+    Get the geometric means of every window of consecutive entries along an axis
+
+    Returns:
+        the geometric means, length T - window + 1 along axis, see rolling_product()
+    '''
+    products = rolling_product(gross, window, axis)
+    if window == 1:
+        return(products)
+    return(np.power(products, 1.0 / window, out = products))
+
+
+def net_value(gross, axis = 0, start = 1.0):
+    '''
+    Get the value of an investment compounding gross returns along an axis
+
+    Returns:
+        the values, length T + 1 along axis: start, then start times the
+        cumulative products
+    '''
+    gross = np.moveaxis(np.asarray(gross, dtype = np.float64), axis, 0)
+    value = np.empty((gross.shape[0] + 1,) + gross.shape[1:])
+    value[0] = start
+    np.cumprod(gross, axis = 0, out = value[1:])
+    value[1:] *= start
+    return(np.moveaxis(value, 0, axis))
@@ -0,0 +1,255 @@
+'''
+Bond-ladder simulation for the stock / bond portfolios of sandbox/matthew/.
+
+BondLadInc.py keeps a ladder of Treasury rungs in three arrays (Btime, the
+years left to maturity, Byield and Bondam), and every year from 1992 to
+2016 it pads the stock covariance into an (N + 1)-by-(N + 1) sigmad with
+np.vstack / np.hstack, rolls the rung that has matured into a new 10-year
+bond (adding BondInc to it), reinvests the coupons of the ladder in the
+stocks and solves a cvxpy problem for the new stock weights, one ladder at
+a time.
+
+The ladder itself does not depend on the stock weights: which rungs mature
+in which year, the yield each rung was bought at, the amount in every rung
+and the coupon rate of the sleeve only depend on the first maturities of
+the rungs, Bondam, BondInc and the yield history.  ladder_schedule()
+therefore computes them for C ladder configurations and Y years at once as
+C-by-Y-by-R arrays (R rungs): rung r of a configuration first matures in
+year m_r and then every `term` years, so in year i it has been rolled
+n = (i - m_r) // term + 1 times (none before year m_r), holds
+Bondam_r + n * BondInc and pays the 10-year yield of its last roll.  Rungs
+are held at par, as in the script, so the sleeve is worth the sum of its
+rungs and returns the amount-weighted yield.  Several rungs may mature in
+the same year (the script assumes one at most).
+
+Only the stocks need an optimisation.  With the bond position b fixed by
+the ladder, the problem of a year
+
+    minimize    xn' Sigma_d xn + tau * ||xn||_1
+    subject to  1' x == S                              (the stock budget)
+                rhat' x + (1 + bond rate) b >= target * last year's wealth
+
+is, after scaling x = S y, the min-variance problem of active_set with
+budget 1, penalty tau / S and floor (target * wealth - (1 + rate) b) / S,
+solved for every configuration with one ActiveSetProblem sharing the
+covariance of the year.  SleeveCovariance adds the bond sleeve (with a
+variance of its own, zero in the script) to the stock covariance as a
+structured (N + 1)-by-(N + 1) matrix, without copying the N-by-N part.
+
+The problem of a year is degenerate (the covariance of 60 months of 313
+stocks is singular, and many weightings reach the same objective), so the
+objectives match those of the script's cvxpy loop but the weights, and the
+wealth paths that follow from them, are not expected to: the active-set
+solution is sparser and the wealth can differ by several percent.
+
+Usage:
+    (maturities, amounts, increments, configs) = ladder_grid([[2, 5, 7, 10], [1, 4, 7, 10]],
+                                                            [0.05, 0.1], [0.0, 0.05])
+    yields = curve_yields(maturities, [2, 5, 7, 10], first_curve)
+    schedule = ladder_schedule(maturities, amounts, increments, yields, gs10_by_year)
+    result = simulate(schedule, sigmas, r_hats, gross_returns, tau = 0.7)
+    # result['wealth'][c, i]: wealth of configuration configs[c] at the end of year i
+'''
+
+import itertools
+
+import numpy as np
+
+from portfolio.active_set import ActiveSetProblem
+from portfolio.factor_model import FactorCovariance
+
+
+class SleeveCovariance(object):
+    '''
+    The covariance of N stocks and a bond sleeve uncorrelated with them
+
+        [ Sigma  0 ]
+        [   0    v ]
+
+    Args:
+        stocks: the N-by-N stock covariance Sigma, or a FactorCovariance
+        bond_variance: the variance v of the return of the sleeve
+    '''
+
+    def __init__(self, stocks, bond_variance = 0.0):
+        self.stocks = stocks
+        self.bond_variance = float(bond_variance)
+        N = stocks.shape[0]
+        self.shape = (N + 1, N + 1)
+
+    def variance(self, x):
+        '''
+        Get x' Sigma_d x of the N + 1 holdings x (the sleeve last) without forming Sigma_d
+        '''
+        x = np.asarray(x, dtype = np.float64).reshape(-1)
+        if isinstance(self.stocks, FactorCovariance):
+            risk = self.stocks.variance(x[:-1])
+        else:
+            risk = np.dot(x[:-1], np.dot(self.stocks, x[:-1]))
+        return(risk + self.bond_variance * x[-1] ** 2)
+
+    def dense(self):
+        '''
+        Returns:
+            the full (N + 1)-by-(N + 1) covariance matrix, as sigmad of BondLadInc.py
+        '''
+        stocks = self.stocks.dense() if isinstance(self.stocks, FactorCovariance) else self.stocks
+        N = self.shape[0] - 1
+        sigma = np.zeros(self.shape)
+        sigma[:N, :N] = stocks
+        sigma[N, N] = self.bond_variance
+        return(sigma)
+
+
+def ladder_grid(rungs, amounts, increments):
+    '''
+    Get every combination of the ladder settings as configuration arrays
+
+    Args:
+        rungs: list of the first maturities (in years, at least 1) of the
+               rungs of each ladder, e.g. [[2, 5, 7, 10], [5, 10]]
+        amounts: list of the amounts first put in each rung (Bondam), each
+                 a scalar or one amount per rung
+        increments: list of the amounts added to a rung when it rolls (BondInc)
+
+    Returns:
+        tuple of the C-by-R first maturities (0 for the missing rungs of the
+        shorter ladders), the C-by-R amounts, the length C increments and the
+        list of the C (rungs, amount, increment) combinations
+    '''
+    configs = list(itertools.product(rungs, amounts, increments))
+    R = max(len(r) for r in rungs)
+    maturities = np.zeros((len(configs), R), dtype = int)
+    holdings = np.zeros((len(configs), R))
+    for (c, (rung, amount, increment)) in enumerate(configs):
+        maturities[c, :len(rung)] = rung
+        holdings[c, :len(rung)] = amount
+    return(maturities, holdings, np.array([c[2] for c in configs], dtype = np.float64), configs)
+
+
+def curve_yields(maturities, curve_maturities, curve):
+    '''
+    Get the yield each rung is first bought at, by linear interpolation of a yield curve
+
+    Args:
+        maturities: C-by-R first maturities of the rungs
+        curve_maturities: increasing maturities of the curve, e.g. [2, 5, 7, 10]
+        curve: the yields at those maturities (GS2, GS5, GS7 and GS10)
+
+    Returns:
+        C-by-R yields
+    '''
+    maturities = np.asarray(maturities)
+    return(np.interp(maturities, curve_maturities, curve).reshape(maturities.shape))
+
+
+def ladder_schedule(maturities, amounts, increments, initial_yields, roll_yields, term = 10):
+    '''
+    Get the rungs of every ladder configuration in every year
+
+    Args:
+        maturities: C-by-R years to the first maturity of the rungs, 0 for no rung
+        amounts: C-by-R amounts first put in the rungs (Bondam)
+        increments: length C amounts added to a rung each time it rolls (BondInc)
+        initial_yields: C-by-R (or length R) yields the rungs are first bought at, in percent
+        roll_yields: length Y yields of the new `term`-year bonds of every year, in percent
+        term: maturity of the bonds a rung rolls into
+
+    Returns:
+        dictionary of 'rolled' (C-by-Y-by-R, whether the rung rolls in the
+        year), 'holdings' and 'yields' (C-by-Y-by-R, after the year's rolls),
+        'sleeve' (C-by-Y, the amount in bonds), 'coupon_rate' (C-by-Y, the
+        amount-weighted yield as a decimal) and 'increment' (C-by-Y, the
+        money moved from the stocks into the rolled rungs)
+    '''
+    maturities = np.asarray(maturities)[:, None, :]
+    amounts = np.asarray(amounts, dtype = np.float64)[:, None, :]
+    increments = np.asarray(increments, dtype = np.float64)[:, None, None]
+    roll_yields = np.asarray(roll_yields, dtype = np.float64).reshape(-1)
+    present = maturities > 0
+    # years since the first maturity, negative before it
+    since = np.arange(roll_yields.shape[0])[None, :, None] - maturities
+    rolled = present & (since >= 0) & (since % term == 0)
+    rolls = np.where(present & (since >= 0), since // term + 1, 0)
+    last_roll = np.where(rolls > 0, maturities + term * (rolls - 1), 0)
+    initial_yields = np.broadcast_to(np.asarray(initial_yields, dtype = np.float64),
+                                     (amounts.shape[0], amounts.shape[2]))
+    yields = np.where(rolls > 0, roll_yields[last_roll], initial_yields[:, None, :])
+    holdings = np.where(present, amounts + rolls * increments, 0.0)
+    sleeve = holdings.sum(axis = 2)
+    coupon_rate = (holdings * yields).sum(axis = 2) / np.where(sleeve > 0, sleeve, 1.0) / 100
+    return({'rolled': rolled, 'holdings': holdings, 'yields': yields, 'sleeve': sleeve,
+            'coupon_rate': coupon_rate, 'increment': rolled.sum(axis = 2) * increments[:, :, 0]})
+
+
+def simulate(schedule, covariances, r_hats, gross_returns, tau, target = 0.95, bond_variance = 0.0,
+             long_only = False):
+    '''
+    Run the stock / bond portfolio of every ladder configuration over the years
+
+    In year i the stocks get last year's stock value plus the coupons of
+    last year's sleeve less the increments of the rungs that roll, and are
+    reallocated by minimising the risk plus tau * ||xn||_1 subject to the
+    expected wealth being at least target times last year's wealth (1
+    before the first year); they then earn gross_returns[i]
+
+    Args:
+        schedule: the dictionary of ladder_schedule(), with Y years
+        covariances: iterable of the Y stock covariances (N-by-N matrices,
+                     FactorCovariances or SleeveCovariances), e.g. a generator
+        r_hats: Y-by-N expected gross returns of the stocks
+        gross_returns: Y-by-N realised gross returns of the stocks
+        tau: the l1 penalty
+        target: the share of last year's wealth the expected wealth must reach
+        bond_variance: the variance of the sleeve, for covariances that are not
+                       SleeveCovariances already
+        long_only: whether the stock weights are constrained to x >= 0
+
+    Returns:
+        dictionary of 'stocks' (C-by-Y-by-N, the money in every stock at the
+        start of the year), 'wealth' (C-by-Y, at the end of the year),
+        'variance' (C-by-Y, of the holdings at the start of the year) and
+        'solved' (C-by-Y; a configuration whose stock budget is not positive
+        or whose return floor cannot be reached is left NaN from that year on)
+    '''
+    sleeve = schedule['sleeve']
+    rate = schedule['coupon_rate']
+    (C, Y) = sleeve.shape
+    r_hats = np.asarray(r_hats, dtype = np.float64)
+    gross_returns = np.asarray(gross_returns, dtype = np.float64)
+    N = r_hats.shape[1]
+    stocks = np.full((C, Y, N), np.nan)
+    wealth = np.full((C, Y), np.nan)
+    variance = np.full((C, Y), np.nan)
+    solved = np.zeros((C, Y), dtype = bool)
+    problem = ActiveSetProblem(N, long_only = long_only)
+    # before the first year: wealth 1, all of it outside the sleeve
+    last_wealth = np.ones(C)
+    last_stocks = 1.0 - sleeve[:, 0]
+    coupons = np.zeros(C)
+    last_rate = rate[:, 0]
+    alive = np.ones(C, dtype = bool)
+    for (i, sigma) in enumerate(covariances):
+        if not isinstance(sigma, SleeveCovariance):
+            sigma = SleeveCovariance(sigma, bond_variance)
+        budget = last_stocks + coupons - schedule['increment'][:, i]
+        floor = target * last_wealth - (1 + last_rate) * sleeve[:, i]
+        for c in np.flatnonzero(alive):
+            if not budget[c] > 0:
+                alive[c] = False
+                continue
+            problem.set_data(r_hats[i], sigma.stocks, floor[c] / budget[c])
+            try:
+                (value, x) = problem.solve(tau / budget[c])
+            except ValueError:
+                alive[c] = False
+                continue
+            stocks[c, i] = budget[c] * x
+            variance[c, i] = sigma.variance(np.append(stocks[c, i], sleeve[c, i]))
+            solved[c, i] = True
+        last_stocks = np.dot(stocks[:, i], gross_returns[i])
+        wealth[:, i] = last_stocks + sleeve[:, i] * (1 + rate[:, i])
+        last_wealth = wealth[:, i]
+        coupons = sleeve[:, i] * rate[:, i]
+        last_rate = rate[:, i]
+    return({'stocks': stocks, 'wealth': wealth, 'variance': variance, 'solved': solved})
@@ -0,0 +1,168 @@
+'''
+Yearly stock characteristics for the parametric policies of 3factor/.
+
+3factor.py and 3factor2.py read ME_yearly.csv, btm_yearly.csv and
+compounded_return_yearly.csv, built outside the repository.  build()
+derives them from the monthly returns panel and the yearly market caps
+(and book equity, for book-to-market), each as a cross-sectional z-score
+of the year:
+
+    ME                 log market cap
+    btm                book equity / market cap
+    compounded_return  the compounded return of the year's 12 months
+
+These are not the definitions of every shipped CSV: the rebuilt ME matches
+ME_yearly.csv (to 7e-15), but compounded_return_yearly.csv is not the
+z-scored compounded return.  It differs from build()'s by up to 9.6 (in
+z-score units; correlation 0.93 over the panel) and is within 0.19 of the
+z-scored mean monthly return of the year, whose exact recipe is not in the
+repository.  So the rebuilt panels are written under their own names and
+3factor.py and 3factor2.py keep reading the shipped files.
+
+The monthly returns are compounded into years by aggregation.compound(),
+one product over the months of the reshaped panel, and the z-scores are
+taken over the rows at once, so there is no loop over years or stocks.
+Missing values (NaN, or a non-positive market cap) stay missing and are
+left out of the cross-sectional moments.
+
+load_characteristics() keeps the built panels in the returns store,
+addressed by the digests of the CSVs they come from, so they are only
+built again when an input changes.
+
+Usage:
+    python -m portfolio.characteristics monthly_return.csv market_cap_yearly.csv --csv-dir .
+    # writes ME_yearly_rebuilt.csv and compounded_return_yearly_rebuilt.csv, never over an existing file
+
+    panels = load_characteristics('monthly_return.csv', 'market_cap_yearly.csv')
+    ME_yearly = panels['ME']
+'''
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from portfolio import aggregation
+from portfolio import returns_store
+
+
+def annual_compound(monthly_returns, months = 12):
+    '''
+    Compound monthly returns into yearly ones
+
+    Args:
+        monthly_returns: T-by-N matrix of monthly returns, T a multiple of months
+        months: number of months in a year
+
+    Returns:
+        (T / months)-by-N matrix of the compounded returns of the years
+    '''
+    return(aggregation.compound(monthly_returns, months))
+
+
+def standardise(panel, ddof = 1):
+    '''
+    Get the cross-sectional z-scores of every row of a panel, ignoring NaNs
+
+    Returns:
+        the panel with every row shifted to mean 0 and scaled to standard deviation 1
+    '''
+    panel = np.asarray(panel, dtype = np.float64)
+    mean = np.nanmean(panel, axis = 1, keepdims = True)
+    sd = np.nanstd(panel, axis = 1, ddof = ddof, keepdims = True)
+    return((panel - mean) / sd)
+
+
+def build(monthly_returns, market_cap, book_equity = None, months = 12):
+    '''
+    Build the yearly characteristics
+
+    Args:
+        monthly_returns: T-by-N monthly returns
+        market_cap: (T / months)-by-N market caps at the end of the years
+        book_equity: optional (T / months)-by-N book equity
+        months: number of months in a year
+
+    Returns:
+        dictionary of the (T / months)-by-N panels 'market_cap', 'ME',
+        'compounded_return' and, with book_equity, 'btm'
+    '''
+    market_cap = np.asarray(market_cap, dtype = np.float64)
+    positive = market_cap > 0
+    panels = {'market_cap': market_cap,
+              'ME': standardise(np.log(np.where(positive, market_cap, np.nan))),
+              'compounded_return': standardise(annual_compound(monthly_returns, months))}
+    if panels['compounded_return'].shape != market_cap.shape:
+        raise ValueError('got %s yearly returns for %s market caps'
+                         % (panels['compounded_return'].shape, market_cap.shape))
+    if book_equity is not None:
+        book_equity = np.asarray(book_equity, dtype = np.float64)
+        panels['btm'] = standardise(book_equity / np.where(positive, market_cap, np.nan))
+    return(panels)
+
+
+def panel_key(digests, name):
+    '''
+    Get the digest a built panel is stored under, from the digests of its inputs
+    '''
+    return(hashlib.sha1(json.dumps(['characteristics', digests, name]).encode('utf-8')).hexdigest())
+
+
+def load_characteristics(returns_csv, market_cap_csv, book_csv = None, store_dir = returns_store.DEFAULT_STORE,
+                         start = '1986'):
+    '''
+    Load the yearly characteristics, building them on first use
+
+    Args:
+        returns_csv: CSV of the T-by-N monthly returns
+        market_cap_csv: CSV of the yearly market caps
+        book_csv: optional CSV of the yearly book equity
+        store_dir: directory holding the panel files
+        start: first year of the rows
+
+    Returns:
+        dictionary of read-only np.memmap panels, see build()
+    '''
+    names = ['market_cap', 'ME', 'compounded_return'] + (['btm'] if book_csv is not None else [])
+    inputs = [returns_csv, market_cap_csv] + ([book_csv] if book_csv is not None else [])
+    digests = [returns_store.source_digest(path, store_dir) for path in inputs]
+    paths = dict((name, returns_store.panel_path(panel_key(digests, name), store_dir)) for name in names)
+    if not all(os.path.exists(path) for path in paths.values()):
+        monthly_returns = returns_store.load_dataset(returns_csv, store_dir)
+        market_cap = returns_store.load_dataset(market_cap_csv, store_dir, start = start, freq = 'A')
+        book_equity = None
+        if book_csv is not None:
+            book_equity = returns_store.load_dataset(book_csv, store_dir, start = start, freq = 'A')
+        panels = build(monthly_returns, market_cap, book_equity)
+        dates = returns_store.make_dates(start, market_cap.shape[0], 'A')
+        for name in names:
+            returns_store.write_panel(paths[name], panels[name], dates, source = name)
+    return(dict((name, returns_store.open_panel(paths[name])[0]) for name in names))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'Build the yearly characteristics of a returns panel')
+    parser.add_argument('returns', help = 'CSV of the monthly returns')
+    parser.add_argument('market_cap', help = 'CSV of the yearly market caps')
+    parser.add_argument('--book', default = None, help = 'CSV of the yearly book equity')
+    parser.add_argument('--store', default = returns_store.DEFAULT_STORE, help = 'panel directory')
+    parser.add_argument('--start', default = '1986', help = 'first year of the rows')
+    parser.add_argument('--csv-dir', default = None,
+                        help = 'also write ME_yearly_rebuilt.csv, compounded_return_yearly_rebuilt.csv '
+                               '(and btm_yearly_rebuilt.csv) here')
+    args = parser.parse_args()
+    panels = load_characteristics(args.returns, args.market_cap, args.book, args.store, args.start)
+    csv_paths = {}
+    if args.csv_dir is not None:
+        csv_paths = dict((name, os.path.join(args.csv_dir, name + '_yearly_rebuilt.csv'))
+                         for name in panels if name != 'market_cap')
+        existing = [path for path in csv_paths.values() if os.path.exists(path)]
+        if existing:
+            parser.error('not overwriting ' + ', '.join(existing))
+    for name in sorted(panels):
+        print(name + ' ' + str(panels[name].shape))
+        if name in csv_paths:
+            np.savetxt(csv_paths[name], panels[name], delimiter = ",")
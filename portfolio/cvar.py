@@ -0,0 +1,276 @@
+'''
+Conditional value-at-risk helpers for minimize_CVaR().
+
+For returns r ~ N(r_hat, Sigma) the loss of a portfolio, -r' x, is normal
+with mean -r_hat' x and standard deviation ||L' x|| (Sigma = L L'), and
+its CVaR at level alpha has the closed form
+
+    CVaR_alpha(x) = -r_hat' x + k(alpha) * ||L' x||,
+    k(alpha) = phi(Phi^-1(alpha)) / (1 - alpha)
+
+so the Gaussian case of minimize_CVaR() is a small second-order cone
+program with no scenarios and no per-scenario auxiliary variables.
+'''
+
+import numpy as np
+import cvxpy as cvx
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.stats import norm
+
+from portfolio.min_variance import covariance_factor
+
+
+def gaussian_cvar_coefficient(alpha):
+    '''
+    Get k(alpha), the number of standard deviations the Gaussian CVaR lies above the mean loss
+    '''
+    return(norm.pdf(norm.ppf(alpha)) / (1 - alpha))
+
+
+def gaussian_cvar(x, r_hat, sigma, alpha):
+    '''
+    Exact CVaR of the loss -r' x for r ~ N(r_hat, sigma)
+
+    Args:
+        x: portfolio weights as a length N vector
+        r_hat: expected returns, N or N-by-1
+        sigma: N-by-N covariance
+        alpha: confidence level, e.g. 0.99
+
+    Returns:
+        the CVaR as a float
+    '''
+    x = np.asarray(x, dtype = np.float64).reshape(-1)
+    r_hat = np.asarray(r_hat, dtype = np.float64).reshape(-1)
+    sd = np.sqrt(max(np.dot(x, np.dot(sigma, x)), 0.0))
+    return(-np.dot(r_hat, x) + gaussian_cvar_coefficient(alpha) * sd)
+
+
+def minimize_gaussian_cvar(r_hat, sigma, alpha, tau, equal_weight_return, factor = None, solver = None):
+    '''
+    Solve minimize_CVaR()'s problem in closed form for Gaussian returns
+
+        minimize    gamma + tau * ||x||_1
+        subject to  -r_hat' x + k(alpha) * ||L' x|| <= gamma,  gamma >= 0
+                    r_hat' x >= equal_weight_return,  1' x == 1,  x >= 0
+
+    Args:
+        r_hat: expected returns, N or N-by-1
+        sigma: N-by-N covariance
+        alpha: confidence level
+        tau: weight of the l1 penalty
+        equal_weight_return: the minimum expected return of the portfolio
+        factor: optional L with sigma = L L', computed from sigma if not given
+        solver: cvxpy solver name, None lets cvxpy choose
+
+    Returns:
+        tuple of the optimal gamma (the CVaR bound) and the optimal weights
+    '''
+    r_hat = np.asarray(r_hat, dtype = np.float64).reshape(-1)
+    N = r_hat.shape[0]
+    L = covariance_factor(sigma) if factor is None else factor
+    x = cvx.Variable(N)
+    gamma = cvx.Variable() # bound for CVaR
+    constraints = [- r_hat @ x + gaussian_cvar_coefficient(alpha) * cvx.norm(L.T @ x, 2) <= gamma,
+                   r_hat @ x >= equal_weight_return,
+                   cvx.sum(x) == 1,
+                   gamma >= 0,
+                   x >= 0]
+    prob = cvx.Problem(cvx.Minimize(gamma + tau * cvx.norm(x, 1)), constraints)
+    prob.solve(solver = solver)
+    return(gamma.value, x.value)
+
+
+def sample_cvar(losses, alpha, probabilities = None):
+    '''
+    CVaR of scenario losses, the Rockafellar-Uryasev value
+    min_w w + E[max(loss - w, 0)] / (1 - alpha)
+
+    Args:
+        losses: length S vector of scenario losses
+        alpha: confidence level
+        probabilities: optional length S vector of scenario probabilities,
+                       by default the scenarios are equally likely
+
+    Returns:
+        tuple of the CVaR and the length S vector of tail weights (summing to one),
+        so that CVaR = weights' losses and weights' samples is a subgradient
+    '''
+    S = losses.shape[0]
+    if probabilities is not None:
+        # fill the tail mass 1 - alpha with the largest losses first
+        order = np.argsort(-losses)
+        mass = np.minimum(np.cumsum(probabilities[order]), 1 - alpha)
+        weights = np.zeros(S)
+        weights[order] = np.diff(np.concatenate(([0.0], mass))) / (1 - alpha)
+        return(np.dot(weights, losses), weights)
+    m = (1 - alpha) * S # number of scenarios in the tail, possibly fractional
+    k = min(int(np.floor(m)), S)
+    order = np.argpartition(-losses, min(k, S - 1))
+    weights = np.zeros(S)
+    weights[order[:k]] = 1.0 / m
+    if k < S and m > k:
+        weights[order[k]] = (m - k) / m
+    return(np.dot(weights, losses), weights)
+
+
+def minimize_cvar_cutting_plane(samples, alpha, r_hat, tau, equal_weight_return, tol = 1e-10, max_iter = 100,
+                                probabilities = None):
+    '''
+    Solve minimize_CVaR()'s scenario problem by cutting planes
+
+        minimize    gamma + tau * ||x||_1
+        subject to  w + sum_k p_k y_k / (1 - alpha) <= gamma,  gamma >= 0
+                    y_k >= -s_k' x - w,  y_k >= 0              for every scenario k
+                    r_hat' x >= equal_weight_return,  1' x == 1,  x >= 0
+
+    At the optimum only the scenarios in the tail (about (1 - alpha) * S of
+    them) have y_k > 0; for every other scenario the constraint is slack and
+    y_k = 0.  So the LP is solved over a small working set of scenarios,
+    the scenarios whose loss -s_k' x then exceeds w the most are added as
+    new cuts, and this repeats until no scenario is violated, at which point the
+    working-set solution solves the full problem.  Checking a candidate
+    costs one S-by-N matrix-vector product; the LP itself only ever holds
+    the active tail scenarios, not the S constraints and S auxiliary
+    variables of the direct formulation.  So the scenarios are only used
+    through samples.dot(x) and samples.take(rows, axis = 0), and they can
+    be given in factored form (scenarios.FactorScenarios).
+
+    Args:
+        samples: S-by-N matrix of scenario returns, or scenarios.FactorScenarios
+        alpha: confidence level
+        r_hat: expected returns, N or N-by-1
+        tau: weight of the l1 penalty
+        equal_weight_return: the minimum expected return of the portfolio
+        tol: a scenario counts as violated when its loss exceeds w by more than this
+        max_iter: maximum number of rounds of cuts
+        probabilities: optional length S vector of the scenario probabilities
+                       p_k (e.g. from scenario_reduction), by default 1 / S
+
+    Returns:
+        tuple of the optimal gamma (the CVaR bound) and the optimal weights
+    '''
+    r_hat = np.asarray(r_hat, dtype = np.float64).reshape(-1)
+    if probabilities is not None:
+        probabilities = np.asarray(probabilities, dtype = np.float64)
+    N = samples.shape[1]
+    # start from the tail of the equally weighted portfolio
+    losses = -samples.dot(np.ones(N) / N)
+    active = tail_rows(losses, alpha, probabilities)
+    (gamma, x, losses, active) = cutting_plane(samples, alpha, r_hat, tau, equal_weight_return, active,
+                                               active.shape[0], tol, max_iter, probabilities)
+    return(gamma, x)
+
+
+def minimize_cvar_cutting_plane_alphas(samples, alphas, r_hat, tau, equal_weight_return, tol = 1e-10,
+                                       max_iter = 100, probabilities = None):
+    '''
+    Solve minimize_cvar_cutting_plane()'s problem for several confidence
+    levels on the same scenarios
+
+    The levels are solved from the largest down, and each starts from the
+    working set of the one before it together with the tail of the losses
+    of its solution, which the last check of the cutting planes already
+    computed; the tail of a larger alpha is nearly a subset of the tail of a
+    smaller one, so most levels need a round or two of cuts.
+
+    Args:
+        samples: S-by-N matrix of scenario returns, or scenarios.FactorScenarios
+        alphas: vector of confidence levels
+        r_hat: expected returns, N or N-by-1
+        tau: weight of the l1 penalty
+        equal_weight_return: the minimum expected return of the portfolio
+        tol: a scenario counts as violated when its loss exceeds w by more than this
+        max_iter: maximum number of rounds of cuts of each level
+        probabilities: optional length S vector of the scenario probabilities
+
+    Returns:
+        tuple of the vector of the optimal gammas and the N-by-len(alphas)
+        matrix of the optimal weights, in the order of alphas
+    '''
+    r_hat = np.asarray(r_hat, dtype = np.float64).reshape(-1)
+    if probabilities is not None:
+        probabilities = np.asarray(probabilities, dtype = np.float64)
+    alphas = np.asarray(alphas, dtype = np.float64).reshape(-1)
+    N = samples.shape[1]
+    gammas = np.zeros(alphas.shape[0])
+    xs = np.zeros((N, alphas.shape[0]))
+    losses = -samples.dot(np.ones(N) / N)
+    active = np.zeros(0, dtype = np.int64)
+    for i in np.argsort(-alphas, kind = 'stable'):
+        tail = tail_rows(losses, alphas[i], probabilities)
+        (gammas[i], xs[:, i], losses, active) = cutting_plane(samples, alphas[i], r_hat, tau, equal_weight_return,
+                                                              np.union1d(active, tail), tail.shape[0], tol,
+                                                              max_iter, probabilities)
+    return(gammas, xs)
+
+
+def tail_rows(losses, alpha, probabilities = None):
+    '''
+    Get the starting working set of the cutting planes: the scenarios of
+    the largest losses, twice the tail mass 1 - alpha of them
+
+    Returns:
+        sorted vector of scenario indices
+    '''
+    S = losses.shape[0]
+    if probabilities is None:
+        size = min(S, 2 * int(np.ceil((1 - alpha) * S)) + 1)
+    else:
+        mass = np.cumsum(probabilities[np.argsort(-losses)])
+        size = min(S, int(np.searchsorted(mass, 2 * (1 - alpha))) + 2)
+    return(np.sort(np.argpartition(-losses, size - 1)[:size]))
+
+
+def cutting_plane(samples, alpha, r_hat, tau, equal_weight_return, active, size, tol, max_iter, probabilities):
+    '''
+    The cutting plane rounds of minimize_cvar_cutting_plane() from the
+    working set active, adding at most size cuts a round
+
+    Returns:
+        tuple of the optimal gamma, the optimal weights, the losses of the
+        weights in every scenario and the final working set
+
+    Raises ValueError when scenarios are still violated after max_iter rounds
+    '''
+    (S, N) = samples.shape
+    if probabilities is None:
+        c_tail = np.full(S, 1.0 / ((1 - alpha) * S))
+    else:
+        c_tail = probabilities / (1 - alpha)
+    for it in range(max_iter):
+        K = active.shape[0]
+        # variables are [x, w, gamma, y_active]; with x >= 0, ||x||_1 = 1' x
+        c = np.concatenate((tau * np.ones(N), [0.0, 1.0], np.zeros(K)))
+        A_ub = sparse.vstack([
+            sparse.hstack([sparse.csr_matrix((1, N)), sparse.csr_matrix([[1.0, -1.0]]),
+                           sparse.csr_matrix(c_tail[active].reshape((1, K)))]),
+            sparse.hstack([sparse.csr_matrix(-samples.take(active, axis = 0)), sparse.csr_matrix(-np.ones((K, 1))),
+                           sparse.csr_matrix((K, 1)), -sparse.identity(K)]),
+            sparse.hstack([sparse.csr_matrix(-r_hat.reshape((1, N))), sparse.csr_matrix((1, 2 + K))])],
+            format = 'csr')
+        b_ub = np.concatenate(([0.0], np.zeros(K), [-equal_weight_return]))
+        A_eq = sparse.hstack([sparse.csr_matrix(np.ones((1, N))), sparse.csr_matrix((1, 2 + K))], format = 'csr')
+        bounds = [(0, None)] * N + [(None, None), (0, None)] + [(0, None)] * K
+        res = linprog(c, A_ub = A_ub, b_ub = b_ub, A_eq = A_eq, b_eq = [1.0],
+                      bounds = bounds, method = 'highs')
+        if res.status != 0:
+            raise ValueError('cutting-plane LP failed: ' + res.message)
+        x = res.x[:N]
+        w = res.x[N]
+        gamma = res.x[N + 1]
+        losses = -samples.dot(x)
+        excess = losses - w
+        excess[active] = 0.0
+        violated = np.flatnonzero(excess > tol)
+        if violated.shape[0] == 0:
+            return(gamma, x, losses, active)
+        # add the worst violations first, at most a tail's worth per round
+        if violated.shape[0] > size:
+            violated = violated[np.argpartition(-excess[violated], size - 1)[:size]]
+        active = np.union1d(active, violated)
+    # the working-set LP is only a relaxation while scenarios are violated,
+    # and its gamma understates the CVaR
+    raise ValueError('cutting planes did not converge in %d rounds (%d scenarios still violated)'
+                     % (max_iter, violated.shape[0]))
@@ -0,0 +1,164 @@
+'''
+On-disk cache of per-window estimates (r_hat, Sigma, factor loadings, ...).
+
+minimize_variance.py, cvar_constraint.py and the fama-french notebook all
+estimate the same moments for the same training windows, and every horizon
+variant does it again.  EstimateCache stores each window's estimates once,
+keyed by
+
+    (dataset digest, window start row, window length, estimator name)
+
+so any strategy can load them back in milliseconds.  The dataset digest is
+the content address of the returns CSV (returns_store.source_digest), so
+copies of the same file in different folders share entries.
+
+Entries are uncompressed .npz files.  A hit touches the file's modification
+time, and whenever the cache grows past max_bytes the least recently used
+entries are deleted until it fits again.
+
+Given the shape of the dataset, get() and put() check an entry against it:
+the window has to lie in the dataset's rows, and an r_hat has to hold N
+numbers and a sigma to be N-by-N, so a malformed entry (e.g. one written by
+a buggy estimator under the same key) is a miss rather than a wrong answer.
+
+Usage:
+    cache = EstimateCache(returns_store.source_digest('monthly_return.csv'), shape = returns.shape)
+    estimates = cache.get(0, 60, 'sample')
+    if estimates is None:
+        estimates = {'r_hat': r_hat, 'sigma': sigma}
+        cache.put(0, 60, 'sample', estimates)
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'data', 'cache')
+
+
+class EstimateCache(object):
+    '''
+    LRU cache of window estimates for one dataset
+
+    Args:
+        dataset: digest of the returns data the windows are cut from
+        shape: optional (rows, N) of the returns data, to check the entries against
+        cache_dir: directory holding the entries, shared by all datasets
+        max_bytes: total size the directory is trimmed back to
+    '''
+
+    def __init__(self, dataset, shape = None, cache_dir = DEFAULT_CACHE, max_bytes = 2 << 30):
+        self.dataset = dataset
+        self.shape = None if shape is None else (int(shape[0]), int(shape[1]))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, start, length, estimator):
+        key = json.dumps([self.dataset, int(start), int(length), estimator])
+        return(os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz'))
+
+    def check(self, start, length, estimates):
+        '''
+        Get why the estimates of a window do not fit the dataset, or None if they do
+        '''
+        if self.shape is None:
+            return(None)
+        (rows, N) = self.shape
+        if start < 0 or length < 1 or start + length > rows:
+            return('window of %d rows from row %d is outside the %d rows of the dataset' % (length, start, rows))
+        if 'r_hat' in estimates and np.shape(estimates['r_hat']) not in ((N,), (N, 1)):
+            return('r_hat has shape %s, not (%d, 1)' % (np.shape(estimates['r_hat']), N))
+        if 'sigma' in estimates and np.shape(estimates['sigma']) != (N, N):
+            return('sigma has shape %s, not (%d, %d)' % (np.shape(estimates['sigma']), N, N))
+        return(None)
+
+    def get(self, start, length, estimator):
+        '''
+        Load the estimates of one window
+
+        Returns:
+            dictionary of arrays as given to put(), or None on a miss or an
+            entry that does not fit the shape of the dataset
+        '''
+        path = self.path(start, length, estimator)
+        try:
+            with np.load(path) as f:
+                estimates = dict((name, f[name]) for name in f.files)
+        except (IOError, OSError, ValueError):
+            return(None)
+        if self.check(start, length, estimates) is not None:
+            return(None)
+        os.utime(path, None)
+        return(estimates)
+
+    def put(self, start, length, estimator, estimates):
+        '''
+        Store the estimates of one window
+
+        Args:
+            start: first row of the window in the dataset
+            length: number of rows in the window
+            estimator: name of the estimator, e.g. 'sample' or 'ff3'
+            estimates: dictionary of numpy arrays
+
+        Raises ValueError when the estimates do not fit the shape of the dataset
+        '''
+        problem = self.check(start, length, estimates)
+        if problem is not None:
+            raise ValueError(problem)
+        path = self.path(start, length, estimator)
+        tmp_path = path[:-len('.npz')] + '.tmp' + str(os.getpid()) + '.npz'
+        np.savez(tmp_path, **dict((name, np.asarray(a)) for name, a in estimates.items()))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_compute(self, start, length, estimator, compute):
+        '''
+        Load the estimates of one window, calling compute() to build and store them on a miss
+        '''
+        estimates = self.get(start, length, estimator)
+        if estimates is None:
+            estimates = compute()
+            self.put(start, length, estimator, estimates)
+        return(estimates)
+
+    def evict(self):
+        '''
+        Delete the least recently used entries until the cache fits in max_bytes
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz') or '.tmp' in name:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        '''
+        Delete every entry in the cache directory
+        '''
+        max_bytes = self.max_bytes
+        self.max_bytes = 0
+        self.evict()
+        self.max_bytes = max_bytes
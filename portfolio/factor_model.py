@@ -0,0 +1,189 @@
+'''
+Factor-model estimation for the training windows.
+
+fama_and_french() in sandbox/josiah/fama-french.ipynb fitted one sm.OLS per
+stock, 556 regressions per window and factor set.  All of those regressions
+share the same design matrix, so ols() fits every stock with one
+least-squares solve with n right-hand sides.
+
+FactorCovariance keeps a covariance in its structured form
+
+    Sigma = B Omega B' + diag(d)
+
+(n-by-k loadings B, k-by-k factor covariance Omega, idiosyncratic
+variances d) instead of as a dense n-by-n matrix.  The optimisers use it
+as ||L' x||^2 + sum(d * x^2) with L = B Omega^(1/2), so the problem size
+grows with n * k rather than n^2.  It is built from a factor regression
+(regression_covariance, as fama_and_french()) or from the leading
+principal components of a sample covariance (pca_covariance).
+
+read_factors() reads the monthly Fama-French factors from the CSV files
+in data/ (as read_factors3() and read_factors5() in the notebook), as
+decimal returns like the returns panels.
+
+Usage:
+    sigma = pca_covariance(np.cov(training_data, rowvar = False), 10)
+    problem = MinVarianceProblem(N, sigma.rank, diagonal = True)
+    problem.set_data(r_hat, sigma, equal_weight_return)
+
+    (factors, names) = read_factors(FF3_FILE)   # 360-by-3, 1986-01 to 2015-12
+    sigma = regression_covariance(training_data, factors[0:60])
+'''
+
+import csv
+import os
+
+import numpy as np
+import cvxpy as cvx
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+FF3_FILE = os.path.join(DATA_DIR, 'F-F_Research_Data_3_Factors.CSV')
+FF5_FILE = os.path.join(DATA_DIR, 'F-F_Research_Data_5_Factors.CSV')
+
+
+def read_factors(path, start = 198601, end = 201512, risk_free = False):
+    '''
+    Read the monthly factors of a Fama-French CSV file
+
+    The file has a few lines of notes, then the monthly table (a header
+    line starting with a comma, then one YYYYMM row per month, in percent),
+    then the annual table, which is not read.
+
+    Args:
+        path: the CSV file, e.g. FF3_FILE or FF5_FILE
+        start: first month kept, as YYYYMM
+        end: last month kept, as YYYYMM
+        risk_free: whether to keep the RF column
+
+    Returns:
+        tuple of the t-by-k matrix of factor returns (as decimals) and the
+        list of the k factor names
+    '''
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    top = [i for i, row in enumerate(rows) if len(row) > 1 and row[0].strip() == ''][0]
+    names = [name.strip() for name in rows[top][1:]]
+    keep = [j for j, name in enumerate(names) if risk_free or name != 'RF']
+    factors = []
+    for row in rows[top + 1:]:
+        if len(row) < 2 or not row[0].strip().isdigit():
+            break
+        if start <= int(row[0]) <= end:
+            factors.append([float(row[1 + j]) for j in keep])
+    return(np.array(factors) / 100.0, [names[j] for j in keep])
+
+
+def ols(y, X):
+    '''
+    Regress every column of y on X at once
+
+    Args:
+        y: t-by-n matrix, one column per regression (e.g. stock returns)
+        X: t-by-p design matrix shared by all regressions
+
+    Returns:
+        tuple of the n-by-p coefficients (one row per column of y)
+        and the length n vector of residual sums of squares
+    '''
+    y = np.asarray(y, dtype = np.float64)
+    X = np.asarray(X, dtype = np.float64)
+    coef = np.linalg.lstsq(X, y, rcond = None)[0]
+    resid = y - np.dot(X, coef)
+    return(coef.T, np.einsum('ij,ij->j', resid, resid))
+
+
+class FactorCovariance(object):
+    '''
+    A covariance matrix B Omega B' + diag(d)
+
+    Args:
+        loadings: n-by-k factor loadings B
+        factor_cov: k-by-k factor covariance Omega
+        idio: length n vector of idiosyncratic variances d
+    '''
+
+    def __init__(self, loadings, factor_cov, idio):
+        self.loadings = np.asarray(loadings, dtype = np.float64)
+        self.factor_cov = np.atleast_2d(np.asarray(factor_cov, dtype = np.float64))
+        self.idio = np.asarray(idio, dtype = np.float64).reshape(-1)
+        self.shape = (self.loadings.shape[0], self.loadings.shape[0])
+        self.rank = self.loadings.shape[1]
+        self.L = None
+
+    def factor(self):
+        '''
+        Returns:
+            L = B Omega^(1/2) as a n-by-k matrix, so that B Omega B' = L L'
+        '''
+        if self.L is None:
+            w, V = np.linalg.eigh(self.factor_cov)
+            self.L = np.dot(self.loadings, V * np.sqrt(np.maximum(w, 0.0)))
+        return(self.L)
+
+    def dense(self):
+        '''
+        Returns:
+            the full n-by-n covariance matrix
+        '''
+        L = self.factor()
+        sigma = np.dot(L, L.T)
+        sigma[np.diag_indices_from(sigma)] += self.idio
+        return(sigma)
+
+    def variance(self, x):
+        '''
+        Get x' Sigma x without forming Sigma
+        '''
+        x = np.asarray(x, dtype = np.float64).reshape(-1)
+        f = np.dot(self.factor().T, x)
+        return(np.dot(f, f) + np.dot(self.idio, x * x))
+
+    def risk(self, x):
+        '''
+        Get x' Sigma x as a cvxpy expression of the variable x
+        '''
+        return(cvx.sum_squares(self.factor().T @ x) + cvx.sum_squares(cvx.multiply(np.sqrt(self.idio), x)))
+
+
+def regression_covariance(returns, factors):
+    '''
+    Structured covariance of a time-series factor regression
+
+    Args:
+        returns: t-by-n matrix of returns
+        factors: t-by-k matrix of factor returns over the same months
+
+    Returns:
+        FactorCovariance with the betas as loadings, the sample covariance of
+        the factors and the residual variances as the diagonal
+    '''
+    factors = np.asarray(factors, dtype = np.float64)
+    if factors.ndim == 1:
+        factors = factors.reshape((-1, 1))
+    (t, k) = factors.shape
+    X = np.column_stack((np.ones(t), factors))
+    coef, rss = ols(returns, X)
+    return(FactorCovariance(coef[:, 1:], np.cov(factors, rowvar = False), rss / (t - k - 1)))
+
+
+def pca_covariance(sigma, k):
+    '''
+    Structured covariance from the k leading principal components of sigma
+
+    Args:
+        sigma: n-by-n sample covariance
+        k: number of components to keep
+
+    Returns:
+        FactorCovariance with the k leading eigenvectors as loadings, their
+        eigenvalues as the (diagonal) factor covariance and what is left of
+        the diagonal of sigma as the idiosyncratic variances, so that the
+        result has the same diagonal as sigma
+    '''
+    sigma = np.asarray(sigma, dtype = np.float64)
+    w, V = np.linalg.eigh(sigma)
+    w = np.maximum(w[::-1][:k], 0.0)
+    V = V[:, ::-1][:, :k]
+    idio = np.maximum(np.diag(sigma) - np.dot(V * V, w), 0.0)
+    return(FactorCovariance(V, np.diag(w), idio))
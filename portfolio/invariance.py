@@ -0,0 +1,141 @@
+'''
+Detect sweep parameters that cannot change the solution of a problem.
+
+minimize_CVaR() minimises gamma + tau * ||x||_1 subject to, among others,
+x >= 0 and 1' x == 1.  On that feasible set ||x||_1 = 1' x = 1, so the
+penalty is the constant tau and every tau of the 46-point sweep has the same
+argmin; the sweep re-solves one problem 46 times (with different sampling
+noise only when each tau draws its own scenarios).
+
+invariant_parameters() finds such parameters by looking at the structure of
+a cvxpy problem: a parameter p is invariant when it enters the problem only
+through one objective term p * h(x), and h is constant on the feasible set.
+The one case recognised for h is the l1 norm (norm(x, 1) or sum(abs(x))) of
+a variable x that the constraints make non-negative and give a fixed sum,
+i.e. a long-only budget constraint.  Constraints that do not involve the
+parameter can be left out of the problem that is analysed: dropping
+constraints only enlarges the feasible set, and a term that is constant on
+the larger set is constant on the smaller one.
+
+Usage:
+    tau = cvx.Parameter(nonneg = True)
+    prob = cvx.Problem(cvx.Minimize(gamma + tau * cvx.norm(x, 1)), [x >= 0, cvx.sum(x) == 1])
+    if is_invariant(prob, tau):
+        ... solve for one tau and reuse the solution for the others
+'''
+
+import numpy as np
+import cvxpy as cvx
+from cvxpy.atoms.affine.add_expr import AddExpression
+from cvxpy.atoms.affine.binary_operators import MulExpression, multiply
+from cvxpy.atoms.affine.sum import Sum
+from cvxpy.atoms.elementwise.abs import abs as abs_atom
+from cvxpy.atoms.norm1 import norm1
+from cvxpy.constraints.nonpos import Inequality
+from cvxpy.constraints.zero import Equality
+
+
+def terms(expr):
+    '''
+    Split a sum of expressions into its terms
+    '''
+    if isinstance(expr, AddExpression):
+        return([t for arg in expr.args for t in terms(arg)])
+    return([expr])
+
+
+def l1_variable(expr):
+    '''
+    Get x if expr is norm(x, 1) or sum(abs(x)) of a variable x, else None
+    '''
+    if isinstance(expr, norm1) and isinstance(expr.args[0], cvx.Variable):
+        return(expr.args[0])
+    if (isinstance(expr, Sum) and isinstance(expr.args[0], abs_atom)
+            and isinstance(expr.args[0].args[0], cvx.Variable)):
+        return(expr.args[0].args[0])
+    return(None)
+
+
+def is_nonneg(x, constraints):
+    '''
+    Check whether x is declared non-negative or constrained by x >= c with c >= 0
+    '''
+    if x.attributes.get('nonneg'):
+        return(True)
+    for c in constraints:
+        if (isinstance(c, Inequality) and c.args[1] is x and c.args[0].is_constant()
+                and np.all(np.asarray(c.args[0].value) >= 0)):
+            return(True)
+    return(False)
+
+
+def sum_coefficient(expr, x):
+    '''
+    Get the scalar k if expr is k * sum(x) for a constant k != 0, else None
+    '''
+    if expr.shape not in ((), (1,), (1, 1)) or expr.variables() != [x] or expr.parameters() or not expr.is_affine():
+        return(None)
+    old = x.value
+    x.value = np.zeros(x.shape)
+    try:
+        grad = expr.grad[x]
+    finally:
+        x.value = old
+    if grad is None:
+        return(None)
+    grad = np.asarray(grad.todense() if hasattr(grad, 'todense') else grad).ravel()
+    if grad.shape[0] != x.size or grad[0] == 0 or not np.allclose(grad, grad[0], rtol = 0, atol = 1e-12 * abs(grad[0])):
+        return(None)
+    return(grad[0])
+
+
+def has_fixed_sum(x, constraints):
+    '''
+    Check whether the constraints include k * sum(x) == c for constants k and c
+    '''
+    for c in constraints:
+        if not isinstance(c, Equality):
+            continue
+        (lhs, rhs) = c.args
+        for (a, b) in ((lhs, rhs), (rhs, lhs)):
+            if b.is_constant() and not b.parameters() and sum_coefficient(a, x) is not None:
+                return(True)
+    return(False)
+
+
+def invariant_parameters(prob):
+    '''
+    Find the parameters of a problem that cannot change its argmin
+
+    Args:
+        prob: a cvx.Problem
+
+    Returns:
+        list of the cvx.Parameters that only scale an objective term which is
+        constant on the feasible set (they still shift the optimal value)
+    '''
+    constraints = prob.constraints
+    in_constraints = set(p.id for c in constraints for p in c.parameters())
+    objective_terms = terms(prob.objective.args[0])
+    invariant = []
+    for p in prob.parameters():
+        if p.id in in_constraints:
+            continue
+        using = [t for t in objective_terms if p.id in set(q.id for q in t.parameters())]
+        if len(using) != 1 or not isinstance(using[0], (multiply, MulExpression)):
+            continue
+        (a, b) = using[0].args
+        (scale, h) = (a, b) if a is p else (b, a)
+        if scale is not p or h.parameters():
+            continue
+        x = l1_variable(h)
+        if x is not None and is_nonneg(x, constraints) and has_fixed_sum(x, constraints):
+            invariant.append(p)
+    return(invariant)
+
+
+def is_invariant(prob, param):
+    '''
+    Check whether param cannot change the argmin of prob (see invariant_parameters)
+    '''
+    return(any(p is param for p in invariant_parameters(prob)))
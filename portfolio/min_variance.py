@@ -0,0 +1,131 @@
+'''
+Reusable cvxpy problem for the l1-penalised min-variance sweep.
+
+minimize_var() used to build a new cvx.Problem for every (year, tau), so
+cvxpy canonicalised the same problem 46 * 25 times.  MinVarianceProblem
+builds it once with the data as cvx.Parameters
+
+    minimize    ||L' x||^2 + tau * ||x||_1
+    subject to  1' x == 1
+                r_hat' x >= floor
+
+where L is a factor of Sigma (Sigma = L L').  The problem is DPP, so cvxpy
+compiles it on the first solve and afterwards only substitutes the new
+parameter values, and each solve is warm started from the previous one
+(the neighbouring tau of the sweep).
+
+For a sample covariance of T months L has at most T - 1 columns, which
+also keeps the problem size at N * T rather than N^2.  With diagonal = True
+the problem takes a factor_model.FactorCovariance, Sigma = L L' + diag(d),
+and the risk term becomes ||L' x||^2 + sum(d * x^2), so a K-factor model
+of any number of assets costs N * K.
+
+Usage:
+    problem = MinVarianceProblem(N, rank = 59)
+    problem.set_data(r_hat, sigma, equal_weight_return)
+    for tau in taus:
+        (optimal_value, optimal_x) = problem.solve(tau)
+'''
+
+import numpy as np
+import cvxpy as cvx
+
+from portfolio.factor_model import FactorCovariance
+
+
+def covariance_factor(sigma, rank = None, tol = 1e-10):
+    '''
+    Factor a covariance matrix as L L'
+
+    Args:
+        sigma: a N-by-N symmetric positive semi-definite matrix
+        rank: maximum number of columns of L, defaults to N
+        tol: eigenvalues below tol times the largest one are treated as zero
+
+    Returns:
+        L as a N-by-r matrix, r <= rank, from the eigendecomposition of sigma
+    '''
+    sigma = np.asarray(sigma, dtype = np.float64)
+    N = sigma.shape[0]
+    rank = N if rank is None else min(rank, N)
+    w, V = np.linalg.eigh(sigma)
+    keep = w > tol * max(w[-1], 0.0)
+    if np.count_nonzero(keep) > rank:
+        raise ValueError('sigma has %d significant eigenvalues, more than rank = %d'
+                         % (np.count_nonzero(keep), rank))
+    return(V[:, keep] * np.sqrt(w[keep]))
+
+
+class MinVarianceProblem(object):
+    '''
+    The min-variance problem of minimize_var() with tau, r_hat, the factor of
+    Sigma and the return floor as parameters
+
+    Args:
+        N: number of assets
+        rank: number of columns of the covariance factor, e.g. T - 1 for a
+              sample covariance over T months, or the number of factors
+        solver: cvxpy solver name, None lets cvxpy choose
+        diagonal: whether Sigma has an idiosyncratic diagonal, i.e. is
+                  given as a FactorCovariance
+    '''
+
+    def __init__(self, N, rank, solver = None, diagonal = False):
+        self.N = N
+        self.rank = rank
+        self.solver = solver
+        self.diagonal = diagonal
+        self.sigma = None
+        self.tau = cvx.Parameter(nonneg = True)
+        self.r_hat = cvx.Parameter(N)
+        self.factor = cvx.Parameter((N, rank))
+        self.floor = cvx.Parameter()
+        self.x = cvx.Variable(N)
+        constraints = [cvx.sum(self.x) == 1,
+                       self.r_hat @ self.x >= self.floor]
+        risk = cvx.sum_squares(self.factor.T @ self.x)
+        if diagonal:
+            self.sqrt_idio = cvx.Parameter(N, nonneg = True)
+            risk = risk + cvx.sum_squares(cvx.multiply(self.sqrt_idio, self.x))
+        obj = cvx.Minimize(risk + self.tau * cvx.norm(self.x, 1))
+        self.prob = cvx.Problem(obj, constraints)
+
+    def set_data(self, r_hat, sigma, floor):
+        '''
+        Load one training window; sigma is only refactored when it is a new matrix
+
+        Args:
+            r_hat: estimated returns as a N-by-1 matrix
+            sigma: estimated covariance as a N-by-N matrix, or a
+                   FactorCovariance when the problem is diagonal
+            floor: the minimum return of the portfolio
+        '''
+        if sigma is not self.sigma:
+            if isinstance(sigma, FactorCovariance):
+                if not self.diagonal:
+                    raise ValueError('a FactorCovariance needs MinVarianceProblem(..., diagonal = True)')
+                L = sigma.factor()
+                if L.shape[1] > self.rank:
+                    raise ValueError('sigma has %d factors, more than rank = %d' % (L.shape[1], self.rank))
+                self.sqrt_idio.value = np.sqrt(sigma.idio)
+            else:
+                L = covariance_factor(sigma, self.rank)
+                if self.diagonal:
+                    self.sqrt_idio.value = np.zeros(self.N)
+            factor = np.zeros((self.N, self.rank))
+            factor[:, :L.shape[1]] = L
+            self.factor.value = factor
+            self.sigma = sigma
+        self.r_hat.value = np.asarray(r_hat, dtype = np.float64).reshape(self.N)
+        self.floor.value = float(floor)
+
+    def solve(self, tau):
+        '''
+        Solve for one tau, warm started from the previous solution
+
+        Returns:
+            tuple of the optimal value and the optimal weights as a length N vector
+        '''
+        self.tau.value = tau
+        self.prob.solve(solver = self.solver, warm_start = True)
+        return(self.prob.value, self.x.value)
@@ -0,0 +1,252 @@
+'''
+Regularisation path of the l1-penalised min-variance problem.
+
+The tau sweep of minimize_variance.py solves
+
+    minimize    x' Sigma x + tau * ||x||_1
+    subject to  1' x == 1
+                r_hat' x >= floor
+
+for 46 values of tau as 46 separate QPs.  Its solution is piecewise linear
+in tau: while the set of non-zero weights, their signs and whether the
+return floor binds stay the same, the KKT conditions
+
+    2 Sigma_AA x_A - lambda 1 - nu r_A = -tau s_A
+    1' x_A = 1,  r_A' x_A = floor  (if the floor binds, else nu = 0)
+
+are a linear system whose right-hand side is affine in tau.  As in Least
+Angle Regression, MinVariancePath follows this solution from tau_max down
+to tau_min, and at each breakpoint one weight leaves or enters the active
+set (or the floor starts or stops binding).  One QP solve at tau_max and
+one small linear solve per breakpoint give the whole path, and the solution
+at any tau in between is read off by linear interpolation, exactly.
+
+It has the set_data() / solve() interface of min_variance.MinVarianceProblem,
+so minimize_var() can use either.
+
+Usage:
+    path = MinVariancePath(N, tau_min = 1.0e-5, tau_max = 1.0)
+    path.set_data(r_hat, sigma, equal_weight_return)
+    for tau in taus:
+        (optimal_value, optimal_x) = path.solve(tau)
+'''
+
+import numpy as np
+
+from portfolio.factor_model import FactorCovariance
+from portfolio.min_variance import MinVarianceProblem
+
+
+class MinVariancePath(object):
+    '''
+    The solutions of minimize_var() for all tau in [tau_min, tau_max]
+
+    Args:
+        N: number of assets
+        tau_min: smallest tau the path is followed to
+        tau_max: largest tau, where the path starts from a QP solve
+        tol: weights below tol (relative to the largest) are taken as zero
+             in the starting QP solution
+        max_breakpoints: the path is abandoned (ValueError) after this many breakpoints
+        solver: cvxpy solver name for the starting QP, None lets cvxpy choose
+    '''
+
+    def __init__(self, N, tau_min, tau_max, tol = 1e-5, max_breakpoints = 10000, solver = None):
+        self.N = N
+        self.tau_min = tau_min
+        self.tau_max = tau_max
+        self.tol = tol
+        self.max_breakpoints = max_breakpoints
+        self.solver = solver
+        self.sigma = None
+        self.r_hat = None
+        self.floor = None
+        self.taus = None
+        self.xs = None
+
+    def set_data(self, r_hat, sigma, floor):
+        '''
+        Load one training window and follow its path
+
+        Args:
+            r_hat: estimated returns as a N-by-1 matrix
+            sigma: estimated covariance as a N-by-N matrix or a FactorCovariance
+            floor: the minimum return of the portfolio
+        '''
+        r_hat = np.asarray(r_hat, dtype = np.float64).reshape(self.N)
+        floor = float(floor)
+        if (sigma is self.sigma and floor == self.floor
+                and self.r_hat is not None and np.array_equal(r_hat, self.r_hat)):
+            return
+        self.sigma = sigma
+        self.r_hat = r_hat
+        self.floor = floor
+        self.Q = sigma.dense() if isinstance(sigma, FactorCovariance) else np.asarray(sigma, dtype = np.float64)
+        self.trace()
+
+    def start(self):
+        '''
+        Solve the QP at tau_max and read off its active set, signs and
+        whether the floor binds.  At a large tau the penalty dominates the
+        objective and the solver's weights are only roughly right, so the
+        guess is corrected one weight at a time (a primal-dual active-set
+        step) until the exact KKT solution of the segment is consistent
+
+        Returns:
+            tuple of the active set, its signs, whether the floor binds and the
+            affine solution of that segment (see segment())
+        '''
+        if isinstance(self.sigma, FactorCovariance):
+            problem = MinVarianceProblem(self.N, self.sigma.rank, self.solver, diagonal = True)
+        else:
+            problem = MinVarianceProblem(self.N, np.linalg.matrix_rank(self.Q), self.solver)
+        problem.set_data(self.r_hat, self.sigma, self.floor)
+        x = problem.solve(self.tau_max)[1]
+        scale = max(np.abs(x).max(), 1.0)
+        active = np.flatnonzero(np.abs(x) > self.tol * scale)
+        signs = np.sign(x[active])
+        binds = np.dot(self.r_hat, x) - self.floor <= 1e-3 * self.tol * max(abs(self.floor), 1.0)
+        tau = self.tau_max
+        for it in range(2 * self.N + 2):
+            (z0, z1) = self.segment(active, signs, binds)
+            z = z0 + tau * z1
+            K = active.shape[0]
+            x = np.zeros(self.N)
+            x[active] = z[:K]
+            g = 2 * np.dot(self.Q, x) - z[K] - z[K + 1] * self.r_hat
+            slack = 1e-9 * max(tau, np.abs(g).max())
+            g[active] = 0.0
+            wrong_sign = signs * z[:K]
+            if wrong_sign.min() <= 0:
+                j = int(np.argmin(wrong_sign))
+                active = np.delete(active, j)
+                signs = np.delete(signs, j)
+            elif np.abs(g).max() > tau + slack:
+                k = int(np.argmax(np.abs(g)))
+                pos = np.searchsorted(active, k)
+                active = np.insert(active, pos, k)
+                signs = np.insert(signs, pos, -np.sign(g[k]))
+            elif binds and z[K + 1] < -slack:
+                binds = False
+            elif not binds and np.dot(self.r_hat, x) < self.floor - slack:
+                binds = True
+            else:
+                return(active, signs, binds, z0, z1)
+        raise ValueError('could not find the active set at tau = %g' % self.tau_max)
+
+    def segment(self, active, signs, binds):
+        '''
+        Solve the KKT system of one active set for its solution as an affine
+        function of tau
+
+        Returns:
+            tuple of (z0, z1) with [x_A, lambda, nu] = z0 + tau * z1
+        '''
+        K = active.shape[0]
+        r_A = self.r_hat[active]
+        M = np.zeros((K + 2, K + 2))
+        M[:K, :K] = 2 * self.Q[np.ix_(active, active)]
+        M[:K, K] = -1.0
+        M[K, :K] = 1.0
+        b0 = np.zeros(K + 2)
+        b1 = np.zeros(K + 2)
+        b0[K] = 1.0
+        b1[:K] = -signs
+        if binds:
+            M[:K, K + 1] = -r_A
+            M[K + 1, :K] = r_A
+            b0[K + 1] = self.floor
+        else:
+            M[K + 1, K + 1] = 1.0 # nu = 0
+        try:
+            z = np.linalg.solve(M, np.column_stack((b0, b1)))
+        except np.linalg.LinAlgError:
+            raise ValueError('singular KKT system on the path with %d active weights' % K)
+        return(z[:, 0], z[:, 1])
+
+    def trace(self):
+        '''
+        Follow the path from tau_max down to tau_min, recording the
+        solution at every breakpoint
+        '''
+        (active, signs, binds, z0, z1) = self.start()
+        tau = self.tau_max
+        taus = []
+        xs = []
+        for it in range(self.max_breakpoints):
+            if it > 0:
+                (z0, z1) = self.segment(active, signs, binds)
+            K = active.shape[0]
+            x0 = np.zeros(self.N)
+            x1 = np.zeros(self.N)
+            x0[active] = z0[:K]
+            x1[active] = z1[:K]
+            taus.append(tau)
+            xs.append(x0 + tau * x1)
+            if tau <= self.tau_min:
+                break
+            # gradient of the smooth part on the inactive weights, a + tau * b
+            inactive = np.ones(self.N, dtype = bool)
+            inactive[active] = False
+            a = 2 * np.dot(self.Q[inactive], x0) - z0[K] - z0[K + 1] * self.r_hat[inactive]
+            b = 2 * np.dot(self.Q[inactive], x1) - z1[K] - z1[K + 1] * self.r_hat[inactive]
+            # every event is the root of an affine function of tau that is
+            # moving towards zero as tau decreases; take the largest root not
+            # above the current tau (several events can fall on the same tau)
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                candidates = [
+                    (-z0[:K] / z1[:K], signs * z1[:K] > 0),     # an active weight reaches zero
+                    (a / (1 - b), b < 1),                       # an inactive gradient reaches +tau
+                    (-a / (1 + b), b > -1)]                     # or -tau
+                if binds:
+                    candidates.append((np.array([-z0[K + 1] / z1[K + 1]]), np.array([z1[K + 1] > 0]))) # nu reaches zero
+                else:
+                    slope = np.dot(self.r_hat, x1)
+                    candidates.append((np.array([(self.floor - np.dot(self.r_hat, x0)) / slope]),
+                                       np.array([slope > 0]))) # the floor is reached
+            best = -np.inf
+            event = None
+            for (kind, (c, moving)) in enumerate(candidates):
+                c = np.where(np.isfinite(c) & moving, np.minimum(c, tau), -np.inf)
+                if c.shape[0] > 0 and c.max() > best:
+                    best = c.max()
+                    event = (kind, int(np.argmax(c)))
+            if best <= self.tau_min:
+                tau = self.tau_min
+                continue
+            tau = best
+            (kind, j) = event
+            if kind == 0:
+                active = np.delete(active, j)
+                signs = np.delete(signs, j)
+            elif kind in (1, 2):
+                k = np.flatnonzero(inactive)[j]
+                pos = np.searchsorted(active, k)
+                active = np.insert(active, pos, k)
+                # entering at g = +tau means x moves negative, at -tau positive
+                signs = np.insert(signs, pos, -1.0 if kind == 1 else 1.0)
+            else:
+                binds = not binds
+        else:
+            raise ValueError('path did not reach tau_min within %d breakpoints' % self.max_breakpoints)
+        # store in increasing tau for interpolation
+        self.taus = np.array(taus[::-1])
+        self.xs = np.array(xs[::-1])
+
+    def solve(self, tau):
+        '''
+        Read the solution for one tau off the path
+
+        Returns:
+            tuple of the optimal value and the optimal weights as a length N vector
+        '''
+        if tau < self.tau_min or tau > self.tau_max:
+            raise ValueError('tau = %g is outside the path [%g, %g]' % (tau, self.tau_min, self.tau_max))
+        i = min(np.searchsorted(self.taus, tau, side = 'right'), self.taus.shape[0] - 1)
+        if i == 0 or self.taus[i] == tau:
+            x = self.xs[i].copy()
+        else:
+            w = (tau - self.taus[i - 1]) / (self.taus[i] - self.taus[i - 1])
+            x = (1 - w) * self.xs[i - 1] + w * self.xs[i]
+        value = np.dot(x, np.dot(self.Q, x)) + tau * np.abs(x).sum()
+        return(value, x)
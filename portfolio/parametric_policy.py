@@ -0,0 +1,178 @@
+'''
+CRRA parametric portfolio policies on stock characteristics.
+
+The policy of 3factor2.max_utility() tilts a benchmark by the N-by-K
+matrix X of (standardised) characteristics of the year,
+
+    x = x_bench + X theta / N,
+
+with theta chosen to maximise the CRRA utility of the wealth the tilt
+would have earned over the previous years.  max_utility() wrote the
+problem out by hand for four years and three characteristics and gave
+cvx.power(1 + a_l' theta, 1 - gamma) to a conic solver, falling back to
+theta = 0 whenever the solve failed.
+
+Year l only enters the problem through its wealth c_l + a_l' theta, so
+policy_summaries() reduces the years to the L-by-K matrix of the a_l
+(and the vector of the c_l) with one einsum over the L years' monthly
+returns and characteristics, whatever L and K, and crra_newton() solves
+
+    minimize    -sum_l u(c_l + a_l' theta)
+    u(W) = W^(1 - gamma) / (1 - gamma),  u(W) = log(W) for gamma = 1
+
+by Newton's method with the analytic gradient -sum_l W_l^-gamma a_l and
+Hessian gamma sum_l W_l^(-gamma - 1) a_l a_l', a K-by-K solve per step.
+The objective is convex, so Newton's method converges in a handful of
+steps from theta = 0.  It has no minimiser when some direction d has
+a_l' d >= 0 for every year and > 0 for one (the wealth can grow without
+limit, which with as few years as characteristics is the rule rather
+than the exception); crra_newton() reports that as 'unbounded', as soon
+as a Newton step is such a direction or by an LP certificate if it has
+not converged after max_iter steps, instead of stopping wherever the
+objective has become too flat to make progress.
+
+Usage:
+    (a, c) = policy_summaries(characteristics, returns)   # L-by-N-by-K, L-by-12-by-N
+    (theta, status) = crra_newton(a, c, gamma = 5)
+    x = policy_weights(x_bench, characteristics[-1], theta)
+'''
+
+import numpy as np
+from scipy.optimize import linprog
+
+
+def policy_summaries(characteristics, returns, benchmark = None, scale = 1.0):
+    '''
+    Reduce the years of a parametric policy to their wealth coefficients
+
+    The wealth of year l is 1 + c_l + a_l' theta, where
+    a_l = scale * sum_m r_lm' X_l and c_l = sum_m r_lm' x_bench_l,
+    summing the monthly returns r_lm of the year over its months
+
+    Args:
+        characteristics: L-by-N-by-K characteristics X_l of the years
+        returns: L-by-M-by-N monthly returns of the year each X_l is held
+        benchmark: optional L-by-N benchmark weights, by default no benchmark (c = 0)
+        scale: the scale of the tilt, e.g. 1 / N
+
+    Returns:
+        tuple of the L-by-K matrix of the a_l and the length L vector of the
+        1 + c_l
+    '''
+    characteristics = np.asarray(characteristics, dtype = np.float64)
+    totals = np.asarray(returns, dtype = np.float64).sum(axis = 1) # L-by-N
+    a = scale * np.einsum('ln,lnk->lk', totals, characteristics)
+    c = np.ones(totals.shape[0])
+    if benchmark is not None:
+        c += np.einsum('ln,ln->l', totals, np.asarray(benchmark, dtype = np.float64))
+    return(a, c)
+
+
+def crra_objective(wealth, gamma):
+    '''
+    Get the negative CRRA utility -sum u(wealth), inf if any wealth is not positive
+    '''
+    if np.any(wealth <= 0):
+        return(np.inf)
+    if gamma == 1:
+        return(-np.sum(np.log(wealth)))
+    return(-np.sum(wealth ** (1 - gamma)) / (1 - gamma))
+
+
+def unbounded_direction(a, tol = 1e-9):
+    '''
+    Look for a direction d with a d >= 0 and sum(a d) > 0, along which the
+    wealth of every year grows and the utility has no maximum
+
+    Returns:
+        d as a length K vector, or None if there is none
+    '''
+    (L, K) = a.shape
+    res = linprog(-a.sum(axis = 0), A_ub = -a, b_ub = np.zeros(L), bounds = [(-1, 1)] * K, method = 'highs')
+    if res.status == 0 and -res.fun > tol * max(np.abs(a).max(), 1.0):
+        return(res.x)
+    return(None)
+
+
+def crra_newton(a, c, gamma, theta0 = None, tol = 1e-12, max_iter = 100):
+    '''
+    Maximise sum_l u(c_l + a_l' theta) over theta by Newton's method
+
+    Args:
+        a: L-by-K matrix of the wealth coefficients of the years
+        c: length L vector of the wealth at theta = 0, all positive
+        gamma: relative risk aversion, positive
+        theta0: optional starting point (e.g. the solution of a nearby gamma),
+                used if every wealth is positive there, by default zero
+        tol: convergence threshold on the Newton decrement lambda^2 / 2,
+             relative to the objective
+        max_iter: maximum number of Newton steps
+
+    Returns:
+        tuple of theta as a length K vector and the status: 'optimal',
+        'unbounded' (no maximum; theta is the last iterate),
+        'line_search' (no step keeps the wealth positive; theta is the last
+        iterate) or 'max_iter' (not converged; theta is the last iterate)
+    '''
+    a = np.asarray(a, dtype = np.float64)
+    c = np.asarray(c, dtype = np.float64).reshape(-1)
+    if gamma <= 0:
+        raise ValueError('gamma should be positive, got %g' % gamma)
+    if np.any(c <= 0):
+        raise ValueError('the wealth at theta = 0 should be positive')
+    theta = np.zeros(a.shape[1])
+    if theta0 is not None and np.all(c + np.dot(a, theta0) > 0):
+        theta = np.array(theta0, dtype = np.float64).reshape(-1)
+    wealth = c + np.dot(a, theta)
+    value = crra_objective(wealth, gamma)
+    for it in range(max_iter):
+        grad = -np.dot(wealth ** -gamma, a)
+        hess = gamma * np.dot(a.T * wealth ** (-gamma - 1), a)
+        try:
+            step = -np.linalg.solve(hess, grad)
+        except np.linalg.LinAlgError:
+            # a rank-deficient a (e.g. fewer years than characteristics)
+            step = -np.linalg.lstsq(hess, grad, rcond = None)[0]
+        decrement = -np.dot(grad, step)
+        # relative to the objective, which tends to 0 as the wealth grows for gamma > 1
+        if decrement / 2 <= tol * max(abs(value), np.finfo(np.float64).tiny):
+            return(theta, 'optimal')
+        ad = np.dot(a, step)
+        if np.all(ad >= -1e-12 * np.abs(ad).max()):
+            # the step raises the wealth of every year: a certificate that there is no maximum
+            return(theta, 'unbounded')
+        # backtrack until the wealth stays positive and the objective drops enough
+        t = 1.0
+        while True:
+            candidate = theta + t * step
+            wealth_candidate = c + np.dot(a, candidate)
+            value_candidate = crra_objective(wealth_candidate, gamma)
+            if value_candidate <= value - 0.25 * t * decrement or t < 1e-12:
+                break
+            t *= 0.5
+        if not np.isfinite(value_candidate):
+            # even the shortest step leaves some wealth non-positive
+            return(theta, 'line_search')
+        (theta, wealth, value) = (candidate, wealth_candidate, value_candidate)
+    if unbounded_direction(a) is not None:
+        return(theta, 'unbounded')
+    return(theta, 'max_iter')
+
+
+def policy_weights(benchmark, characteristics, theta, scale = None):
+    '''
+    Get the weights x_bench + scale * X theta of a parametric policy
+
+    Args:
+        benchmark: length N benchmark weights
+        characteristics: N-by-K characteristics X of the year
+        theta: length K policy coefficients
+        scale: the scale of the tilt, by default 1 / N
+
+    Returns:
+        length N vector of weights
+    '''
+    characteristics = np.asarray(characteristics, dtype = np.float64)
+    N = characteristics.shape[0]
+    scale = 1.0 / N if scale is None else scale
+    return(np.ravel(benchmark) + scale * np.dot(characteristics, np.ravel(theta)))
@@ -0,0 +1,252 @@
+'''
+Memory-mapped binary store for returns panels.
+
+A panel is a T-by-N float64 matrix (periods along the rows, assets along
+the columns) written once from its CSV and then opened with np.memmap, so
+loading it costs a header read instead of a full text parse.
+
+Panel files are content addressed: each one is named after the sha1 of
+the CSV it came from, so every copy of the same CSV in the sandbox maps to
+a single binary file.  The file layout is
+
+    8 bytes   magic, b'RPANEL01'
+    8 bytes   little-endian uint64, length of the JSON header
+    header    JSON with shape, dtype, dates, tickers and source name,
+              padded with spaces so the data starts on a 64 byte boundary
+    data      the panel in C order
+
+Usage:
+    python -m portfolio.returns_store monthly_return.csv --start 1986-01
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b'RPANEL01'
+ALIGN = 64
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'data', 'store')
+INDEX_NAME = 'index.json'
+
+
+def file_digest(path, chunk_size = 1 << 20):
+    '''
+    Get the sha1 of a file's contents
+
+    Args:
+        path: the file to hash
+        chunk_size: number of bytes read at a time
+
+    Returns:
+        the hex digest as a string
+    '''
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return(h.hexdigest())
+
+
+def make_dates(start, periods, freq = 'M'):
+    '''
+    Build period labels for the rows of a panel
+
+    Args:
+        start: first period as 'YYYY-MM' (monthly) or 'YYYY' (annual)
+        periods: number of rows
+        freq: 'M' for monthly or 'A' for annual labels
+
+    Returns:
+        list of strings, e.g. ['1986-01', '1986-02', ...]
+    '''
+    if start is None:
+        return([])
+    if freq == 'A':
+        year = int(str(start)[:4])
+        return([str(year + t) for t in range(periods)])
+    if freq == 'M':
+        year, month = [int(s) for s in str(start).split('-')[:2]]
+        first = 12 * year + month - 1
+        return(['%04d-%02d' % ((first + t) // 12, (first + t) % 12 + 1) for t in range(periods)])
+    raise ValueError('freq should be M or A, got %r' % (freq,))
+
+
+def write_panel(path, data, dates = None, tickers = None, source = None):
+    '''
+    Write a panel file
+
+    Args:
+        path: where to write the panel
+        data: a T-by-N array of returns
+        dates: optional list of T row labels
+        tickers: optional list of N column labels, defaults to s_1 ... s_N
+        source: optional name of the file the panel was built from
+    '''
+    data = np.ascontiguousarray(data, dtype = np.float64)
+    if data.ndim == 1:
+        data = data.reshape((data.shape[0], 1))
+    T, N = data.shape
+    dates = list(dates) if dates is not None else []
+    tickers = list(tickers) if tickers is not None else ['s_' + str(j + 1) for j in range(N)]
+    if dates and len(dates) != T:
+        raise ValueError('got %d dates for %d rows' % (len(dates), T))
+    if len(tickers) != N:
+        raise ValueError('got %d tickers for %d columns' % (len(tickers), N))
+    header = json.dumps({'shape': [T, N], 'dtype': '<f8', 'dates': dates,
+                         'tickers': tickers, 'source': source}).encode('utf-8')
+    pad = (-(len(MAGIC) + 8 + len(header))) % ALIGN
+    header = header + b' ' * pad
+    # write to a temporary name first so a reader never sees half a panel
+    tmp_path = path + '.tmp' + str(os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(data.astype('<f8', copy = False).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    '''
+    Read the JSON header of a panel file
+
+    Returns:
+        tuple of the header dictionary and the byte offset of the data
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a returns panel')
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    return(header, len(MAGIC) + 8 + length)
+
+
+def open_panel(path):
+    '''
+    Open a panel file without reading the data
+
+    Args:
+        path: a file written by write_panel
+
+    Returns:
+        tuple of a read-only T-by-N np.memmap, the list of dates and the list of tickers
+    '''
+    header, offset = read_header(path)
+    data = np.memmap(path, dtype = header['dtype'], mode = 'r', offset = offset,
+                     shape = tuple(header['shape']))
+    return(data, header['dates'], header['tickers'])
+
+
+def _read_index(store_dir):
+    try:
+        with open(os.path.join(store_dir, INDEX_NAME)) as f:
+            return(json.load(f))
+    except (IOError, ValueError):
+        return({})
+
+
+def _write_index(store_dir, index):
+    path = os.path.join(store_dir, INDEX_NAME)
+    tmp_path = path + '.tmp' + str(os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent = 1, sort_keys = True)
+    os.replace(tmp_path, path)
+
+
+def source_digest(csv_path, store_dir = DEFAULT_STORE):
+    '''
+    Get the content digest of a CSV, hashing it only when the file has
+    changed since the last lookup (by size and modification time)
+    '''
+    st = os.stat(csv_path)
+    key = os.path.abspath(csv_path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    index = _read_index(store_dir)
+    entry = index.get(key)
+    if entry is not None and entry['stamp'] == stamp:
+        return(entry['digest'])
+    digest = file_digest(csv_path)
+    if os.path.isdir(store_dir):
+        index[key] = {'stamp': stamp, 'digest': digest}
+        _write_index(store_dir, index)
+    return(digest)
+
+
+def panel_path(digest, store_dir = DEFAULT_STORE):
+    return(os.path.join(store_dir, digest + '.panel'))
+
+
+def convert_csv(csv_path, store_dir = DEFAULT_STORE, start = None, freq = 'M', labelled = False):
+    '''
+    One-time conversion of a returns CSV into a panel file
+
+    Args:
+        csv_path: the CSV, either bare numbers (as in the zhenyuan/ folders)
+                  or, with labelled = True, a ticker header row and a date column
+        store_dir: directory holding the panel files
+        start: first period of the rows, e.g. '1986-01'; ignored if labelled
+        freq: 'M' or 'A', see make_dates
+        labelled: whether the CSV carries its own tickers and dates
+
+    Returns:
+        path of the panel file
+    '''
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    path = panel_path(source_digest(csv_path, store_dir), store_dir)
+    if os.path.exists(path):
+        return(path)
+    if labelled:
+        import pandas as pd
+        df = pd.read_csv(csv_path, index_col = 0)
+        data = df.values
+        dates = [str(d) for d in df.index]
+        tickers = [str(c) for c in df.columns]
+    else:
+        data = np.genfromtxt(csv_path, delimiter = ",")
+        dates = make_dates(start, data.shape[0], freq)
+        tickers = None
+    write_panel(path, data, dates, tickers, source = os.path.basename(csv_path))
+    return(path)
+
+
+def load_panel(csv_path, store_dir = DEFAULT_STORE, start = None, freq = 'M', labelled = False):
+    '''
+    Load a returns panel with its labels, converting the CSV on first use
+
+    Returns:
+        tuple of a read-only T-by-N np.memmap, the list of dates and the list of tickers
+    '''
+    return(open_panel(convert_csv(csv_path, store_dir, start, freq, labelled)))
+
+
+def load_dataset(csv_path, store_dir = DEFAULT_STORE, start = None, freq = 'M', labelled = False):
+    '''
+    Drop-in replacement for np.genfromtxt(csv_path, delimiter=",")
+
+    Returns:
+        a read-only T-by-N np.memmap of the CSV's values
+    '''
+    return(load_panel(csv_path, store_dir, start, freq, labelled)[0])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = 'Convert returns CSVs into memory-mapped panels')
+    parser.add_argument('csv', nargs = '+', help = 'CSV files to convert')
+    parser.add_argument('--store', default = DEFAULT_STORE, help = 'panel directory')
+    parser.add_argument('--start', default = None, help = 'first period, e.g. 1986-01')
+    parser.add_argument('--freq', default = 'M', choices = ['M', 'A'])
+    parser.add_argument('--labelled', action = 'store_true',
+                        help = 'CSV has a ticker header row and a date column')
+    args = parser.parse_args()
+    for csv_path in args.csv:
+        path = convert_csv(csv_path, args.store, args.start, args.freq, args.labelled)
+        header, offset = read_header(path)
+        print(csv_path + ' -> ' + path + ' ' + str(tuple(header['shape'])))
@@ -0,0 +1,131 @@
+'''
+Incremental mean and covariance over a sliding window of returns.
+
+preprocessing() used to call training_data.mean and np.cov on the whole
+60-month window for every year, although consecutive windows share 48 of
+their 60 rows.  RollingMoments keeps the running sum and the matrix of
+cross-products of the rows currently in the window, so moving the window
+by k rows is a rank-k downdate plus a rank-k update, O(k * N^2) instead of
+O(window * N^2).  Any step size works, so the same engine serves yearly
+(k = 12) and monthly (k = 1) rebalancing.
+
+The data are centred on the mean of the first window before accumulating,
+which keeps the cross-products small and the cancellation in
+C - T * m * m' harmless, and the sums are rebuilt from scratch every
+`refresh` moves so rounding error cannot build up over long runs.  The
+updates go through BLAS dgemm/dger in place on a Fortran-ordered matrix,
+so a move touches the N-by-N memory once rather than once per temporary.
+
+Usage:
+    moments = RollingMoments(allReturns, window = 60)
+    for start in range(0, 300, 12):
+        moments.seek(start)
+        r_hat, sigma = moments.mean(), moments.cov()
+'''
+
+import numpy as np
+from scipy.linalg import blas
+
+
+class RollingMoments(object):
+    '''
+    Running first and second moments of allReturns[start:start + window, :]
+
+    Args:
+        returns: a T-by-N array (months along the rows, assets along the columns)
+        window: number of rows in the window
+        start: first row of the initial window
+        refresh: recompute the sums exactly after this many incremental moves
+    '''
+
+    def __init__(self, returns, window, start = 0, refresh = 100):
+        self.returns = returns
+        self.window = window
+        self.refresh = refresh
+        self.shift = np.asarray(returns[start:start + window, :], dtype = np.float64).mean(axis = 0)
+        self._rebuild(start)
+
+    def _rows(self, lo, hi):
+        if lo < 0 or hi > self.returns.shape[0]:
+            raise IndexError('window [%d, %d) is outside the %d rows of data'
+                             % (lo, hi, self.returns.shape[0]))
+        return(np.asarray(self.returns[lo:hi, :], dtype = np.float64) - self.shift)
+
+    def _rebuild(self, start):
+        rows = self._rows(start, start + self.window)
+        self.sum = rows.sum(axis = 0)
+        self.cross = np.asfortranarray(np.dot(rows.T, rows))
+        self.start = start
+        self.moves = 0
+
+    def seek(self, start):
+        '''
+        Move the window so that it begins at row `start`
+
+        Moves of fewer than `window` rows are applied as rank updates,
+        anything else (or every `refresh` moves) rebuilds the sums.
+        '''
+        step = start - self.start
+        if step == 0:
+            return
+        if abs(step) >= self.window or self.moves >= self.refresh:
+            self._rebuild(start)
+            return
+        if step > 0:
+            leaving = self._rows(self.start, start)
+            entering = self._rows(self.start + self.window, start + self.window)
+        else:
+            leaving = self._rows(start + self.window, self.start + self.window)
+            entering = self._rows(start, self.start)
+        self.sum += entering.sum(axis = 0) - leaving.sum(axis = 0)
+        # cross += entering' * entering - leaving' * leaving, as one rank-2k update
+        self.cross = blas.dgemm(1.0, np.vstack((entering, -leaving)), np.vstack((entering, leaving)),
+                                beta = 1.0, c = self.cross, trans_a = 1, overwrite_c = 1)
+        self.start = start
+        self.moves += 1
+
+    def advance(self, step = 12):
+        '''
+        Slide the window forward by `step` rows
+        '''
+        self.seek(self.start + step)
+
+    def mean(self):
+        '''
+        Returns:
+            the window mean as a N-by-1 matrix, the same as preprocessing()'s r_hat
+        '''
+        r_hat = self.sum / self.window + self.shift
+        r_hat.shape = (r_hat.shape[0], 1)
+        return(r_hat)
+
+    def cov(self):
+        '''
+        Returns:
+            the N-by-N sample covariance of the window (ddof = 1, as np.cov)
+        '''
+        m = self.sum / self.window
+        sigma = np.multiply(self.cross, 1.0 / (self.window - 1), order = 'F')
+        sigma = blas.dger(-float(self.window) / (self.window - 1), m, m, a = sigma, overwrite_a = 1)
+        return(sigma)
+
+
+def rolling_moments(returns, window, step = 12, start = 0, stop = None):
+    '''
+    Iterate over evenly spaced windows of the returns
+
+    Args:
+        returns: a T-by-N array
+        window: number of rows in each window
+        step: rows between the starts of consecutive windows (12 for yearly, 1 for monthly)
+        start: first row of the first window
+        stop: last row (exclusive) any window may reach, defaults to T
+
+    Yields:
+        tuples of (window start, r_hat as N-by-1, sigma as N-by-N)
+    '''
+    stop = returns.shape[0] if stop is None else stop
+    moments = RollingMoments(returns, window, start)
+    for s in range(start, stop - window + 1, step):
+        moments.seek(s)
+        yield (s, moments.mean(), moments.cov())
@@ -0,0 +1,160 @@
+'''
+Scenario reduction for the CVaR problems.
+
+The scenario LP of minimize_CVaR() has a constraint and an auxiliary
+variable per scenario, and its cost grows with the 1000 - 10000 scenarios
+it is given, although the CVaR at alpha = 0.99 only depends on the worst
+1% of them.  reduce_scenarios() compresses the scenarios into a few
+hundred weighted ones:
+
+    - the tail is kept as it is: the scenarios with the largest losses of
+      the equally weighted portfolio, tail times the (1 - alpha) share of
+      them, each with its probability 1 / S, so the CVaR of the equally
+      weighted portfolio is that of the full sample;
+    - the rest (the body) is clustered by k-means, and every cluster is
+      replaced by its mean with the cluster's share of the probability,
+      which keeps the mean of the body; with match_moments the means are
+      then moved by the linear map that restores the covariance of the body
+      as well (moment matching).  That map scales the means outward, so a
+      mean whose loss of the equally weighted portfolio would then exceed
+      the smallest kept tail loss is pulled back towards its unmatched
+      position until it does not: the body stays out of the tail, and the
+      CVaR of the equally weighted portfolio is that of the full sample.
+
+The LP then takes the probabilities of the scenarios instead of the
+uniform 1 / S (see cvar.minimize_cvar_cutting_plane).
+
+Only the tail of the equally weighted portfolio is kept, not that of the
+portfolio being optimised, whose tail can fall in the clustered body, so
+the error of the reduced problem is not bounded.  On 10000 Gaussian
+scenarios (sandbox/zhenyuan/cvar_constraint/benchmark_reduction.py) the
+solution on 500 reduced scenarios has a CVaR over all of them 2.5 - 16%
+above the optimum, and up to 160% on 250, at times worse than a plain
+subsample; and reducing then solving (1.5 - 3.4s) is slower than the
+cutting planes on all the scenarios (0.2 - 0.5s), which only ever hold the
+tail.  So the scripts do not use it.
+
+The samples of a year lie in the affine span of r_hat and the columns of
+the factor of Sigma (rank 59 for 60 months), so the body is clustered in
+the coordinates of that span, which gives the same clusters as the N
+returns at a fraction of the cost.
+
+Usage:
+    (reduced, probabilities) = reduce_scenarios(samples, 500, alpha)
+    (gamma, x) = cvar.minimize_cvar_cutting_plane(reduced, alpha, r_hat, tau, floor,
+                                                  probabilities = probabilities)
+'''
+
+import numpy as np
+
+
+def symmetric_power(C, power, tol = 1e-12):
+    '''
+    Get C^power of a symmetric positive semi-definite C, with the
+    eigenvalues below tol times the largest one treated as zero (so power
+    -1/2 gives the pseudo-inverse square root)
+    '''
+    (w, V) = np.linalg.eigh(C)
+    keep = w > tol * max(w[-1], 0.0)
+    return(np.dot(V[:, keep] * w[keep] ** power, V[:, keep].T))
+
+
+def kmeans(points, k, rng = None, max_iter = 20):
+    '''
+    Cluster points by k-means, seeded by k-means++
+
+    The k-means++ seeding keeps the distance of every point to its nearest
+    centre, so each centre costs one pass over the points (scipy's kmeans2
+    recomputes the distances to all centres for every new one, which is
+    quadratic in k), and the Lloyd steps get all distances from one matmul
+
+    Args:
+        points: n-by-d matrix
+        k: number of clusters
+        rng: optional np.random.Generator, by default the global np.random state is used
+        max_iter: maximum number of Lloyd steps
+
+    Returns:
+        length n vector of the cluster of every point
+    '''
+    uniform = np.random.random_sample if rng is None else rng.random
+    n = points.shape[0]
+    chosen = [min(int(uniform() * n), n - 1)]
+    d2 = ((points - points[chosen[0]]) ** 2).sum(axis = 1)
+    for j in range(1, k):
+        i = min(int(np.searchsorted(np.cumsum(d2), uniform() * d2.sum())), n - 1)
+        chosen.append(i)
+        d2 = np.minimum(d2, ((points - points[i]) ** 2).sum(axis = 1))
+    centres = points[chosen]
+    labels = None
+    for it in range(max_iter):
+        distances = (centres ** 2).sum(axis = 1) - 2 * np.dot(points, centres.T)
+        new_labels = np.argmin(distances, axis = 1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength = k)
+        sums = np.zeros(centres.shape)
+        np.add.at(sums, labels, points)
+        # an empty cluster keeps its centre
+        centres = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centres)
+    return(labels)
+
+
+def reduce_scenarios(samples, num_reduced, alpha, tail = 3.0, match_moments = True, rng = None, max_iter = 20):
+    '''
+    Compress equally likely scenarios into fewer weighted ones
+
+    Args:
+        samples: S-by-N matrix of scenario returns
+        num_reduced: number of scenarios to keep, tail ones included
+        alpha: confidence level of the CVaR
+        tail: the tail scenarios kept, as a multiple of (1 - alpha) * S
+        match_moments: whether to restore the covariance of the body
+        rng: optional np.random.Generator of the k-means initialisation
+        max_iter: number of k-means iterations
+
+    Returns:
+        tuple of the num_reduced-by-N (at most) matrix of scenarios and the
+        vector of their probabilities, which sum to one
+    '''
+    (S, N) = samples.shape
+    if num_reduced >= S:
+        return(samples, np.full(S, 1.0 / S))
+    losses = -samples.mean(axis = 1)
+    m = min(int(np.ceil(tail * (1 - alpha) * S)), num_reduced - 1)
+    if m < 1:
+        raise ValueError('no tail scenario is kept (num_reduced = %d, tail = %g, alpha = %g)'
+                         % (num_reduced, tail, alpha))
+    order = np.argsort(-losses)
+    (worst, rest) = (np.sort(order[:m]), order[m:])
+    body = samples[rest]
+    mean = body.mean(axis = 0)
+    # coordinates of the body in its span
+    (U, s, Vt) = np.linalg.svd(body - mean, full_matrices = False)
+    keep = s > 1e-10 * s[0]
+    coords = U[:, keep] * s[keep]
+    labels = kmeans(coords, num_reduced - m, rng, max_iter)
+    counts = np.bincount(labels, minlength = num_reduced - m)
+    used = counts > 0
+    sums = np.zeros((num_reduced - m, coords.shape[1]))
+    np.add.at(sums, labels, coords)
+    centres = sums[used] / counts[used, None]
+    weights = counts[used] / float(rest.shape[0])
+    representatives = mean + np.dot(centres, Vt[keep])
+    if match_moments:
+        # the map A with A C_reduced A' = C_body, C_body = diag(s^2) / n in these coordinates
+        reduced_cov = np.dot(centres.T * weights, centres)
+        A = np.dot(np.diag(s[keep] / np.sqrt(rest.shape[0])), symmetric_power(reduced_cov, -0.5))
+        matched = mean + np.dot(np.dot(centres, A.T), Vt[keep])
+        # a cluster mean loses no more than the worst body scenario, so the
+        # point of the segment to its matched position at the smallest tail
+        # loss is well defined
+        threshold = losses[order[m - 1]]
+        (before, after) = (-representatives.mean(axis = 1), -matched.mean(axis = 1))
+        over = after > threshold
+        t = np.ones(after.shape[0])
+        t[over] = (threshold - before[over]) / (after[over] - before[over])
+        representatives += t[:, None] * (matched - representatives)
+    return(np.vstack((samples[worst], representatives)),
+           np.concatenate((np.full(m, 1.0 / S), weights * rest.shape[0] / S)))
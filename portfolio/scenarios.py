@@ -0,0 +1,300 @@
+'''
+Scenario generation for the CVaR problems.
+
+minimize_CVaR() drew its scenarios itself: np.random.multivariate_normal
+re-factorised Sigma (by SVD) on every call, i.e. once per tau for the same
+year, and the bootstrap copied rows one at a time in a Python loop.
+ScenarioGenerator holds one year's estimates, factorises Sigma once, draws
+with a single matrix product (Gaussian) or one fancy-indexing gather
+(bootstrap), and keeps the draws, so every tau of the year is solved
+against the same scenario matrix (common random numbers).
+
+Sigma is factored by its eigendecomposition (see min_variance.covariance_factor)
+rather than by Cholesky, because a sample covariance over 60 months of 201
+or 556 stocks is singular and has no Cholesky factor.
+
+The Gaussian scenarios are r_hat + L z for standard normal z, and the
+sampling method chooses how z is drawn, to reach the accuracy of plain
+Monte Carlo ('mc') with fewer scenarios:
+
+    'sobol'       scrambled Sobol points mapped through the normal quantile,
+                  a randomised quasi-Monte Carlo sample (num_sample should
+                  be a power of 2)
+    'antithetic'  pairs z, -z, so the sample mean is exact and the sample is
+                  symmetric about r_hat
+    'stratified'  z projected on the loss direction of one portfolio (by
+                  default the equally weighted one) is drawn from num_sample
+                  equally likely strata, one draw per stratum, so the tail of
+                  the losses of portfolios near it holds exactly its
+                  (1 - alpha) share of the scenarios; the rest of z is plain
+                  Monte Carlo
+
+See convergence_scenarios.py under sandbox/zhenyuan/cvar_constraint for the
+CVaR error of each method against the number of scenarios.
+
+When sigma is a factor_model.FactorCovariance, B Omega B' + diag(d) with
+k factors, the scenarios are drawn from the model instead of from a
+factor of the dense sigma,
+
+    r_hat + L f + sqrt(d) * e,    L = B Omega^(1/2)
+
+from k factor shocks f (drawn by the sampling method) and N independent
+idiosyncratic shocks e, so drawing S scenarios costs O(S N k) instead of
+O(S N r) for the rank r of the sample covariance (59 for 60 months) or
+O(S N^2) for a full rank one.  The scenarios are assembled a chunk of
+rows at a time, and factored() keeps them in factored form, the S-by-k
+factor shocks and the seeds of the idiosyncratic ones (FactorScenarios),
+which cvar.minimize_cvar_cutting_plane takes in place of the S-by-N
+matrix, so a universe of thousands of assets never holds the matrix.
+
+For runs that spread the years over processes, task_rng() gives every task
+its own generator from one seed: the generators are the nodes of a
+np.random.SeedSequence tree addressed by the task's key (e.g. the index of
+the year), so a task draws the same scenarios whichever process runs it,
+and in whatever order, and the result of a run does not depend on the
+number of workers.
+
+Usage:
+    scenarios = ScenarioGenerator(r_hat, sigma, training_data)
+    for tau in taus:
+        samples = scenarios.gaussian(1000)   # the same matrix for every tau
+
+    scenarios = ScenarioGenerator(r_hat, sigma, training_data, sampling = 'sobol')
+
+    # reproducible in parallel: the stream of year k of a run with seed
+    scenarios = ScenarioGenerator(r_hat, sigma, training_data, rng = task_rng(seed, k))
+
+    # from a factor model, in factored form
+    sigma = factor_model.regression_covariance(training_data, factors)
+    samples = ScenarioGenerator(r_hat, sigma, rng = task_rng(seed, k)).factored(10000)
+'''
+
+import numpy as np
+from scipy.stats import norm, qmc
+
+from portfolio.factor_model import FactorCovariance
+from portfolio.min_variance import covariance_factor
+
+samplings = ('mc', 'sobol', 'antithetic', 'stratified')
+
+
+def task_rng(seed, *key):
+    '''
+    Get the generator of one task of a run
+
+    Args:
+        seed: the entropy of the run, an int (e.g. np.random.SeedSequence().entropy)
+        key: ints addressing the task, e.g. (year index, alpha index)
+
+    Returns:
+        np.random.Generator seeded by the node of the seed's SeedSequence tree
+        at key, the same as spawning children down the key from the root
+    '''
+    return(np.random.default_rng(np.random.SeedSequence(seed, spawn_key = key)))
+
+
+class FactorScenarios(object):
+    '''
+    Gaussian scenarios of a factor model in factored form
+
+        s_i = r_hat + L f_i + sqrt(d) * e_i
+
+    The S-by-k factor shocks f are kept; the idiosyncratic shocks e of
+    every chunk of rows are drawn again from the chunk's own stream
+    whenever the chunk is needed, so the scenarios take O(S k + chunk N)
+    memory.  Supports the part of the interface of an S-by-N matrix that
+    cvar.minimize_cvar_cutting_plane uses: shape, dot(x) and
+    take(rows, axis = 0)
+
+    Args:
+        r_hat: expected returns as a length N vector
+        L: N-by-k factor of the factor covariance, B Omega^(1/2)
+        idio: length N vector of the idiosyncratic variances d
+        shocks: S-by-k factor shocks f
+        entropy: seed of the idiosyncratic shocks, chunk j is drawn from task_rng(entropy, j)
+        chunk: number of rows assembled at a time
+    '''
+
+    def __init__(self, r_hat, L, idio, shocks, entropy, chunk = 256):
+        self.r_hat = r_hat
+        self.L = L
+        self.sd = np.sqrt(idio)
+        self.shocks = shocks
+        self.entropy = entropy
+        self.chunk = chunk
+        self.shape = (shocks.shape[0], L.shape[0])
+
+    def idiosyncratic(self, j):
+        '''
+        Returns:
+            the idiosyncratic shocks of chunk j scaled by sqrt(d), rows j * chunk onwards
+        '''
+        rows = min(self.chunk, self.shape[0] - j * self.chunk)
+        return(task_rng(self.entropy, j).standard_normal((rows, self.shape[1])) * self.sd)
+
+    def block(self, j):
+        '''
+        Returns:
+            the scenarios of chunk j as a matrix
+        '''
+        start = j * self.chunk
+        factor_part = np.dot(self.shocks[start:start + self.chunk], self.L.T)
+        return(self.r_hat + factor_part + self.idiosyncratic(j))
+
+    def num_chunks(self):
+        return((self.shape[0] + self.chunk - 1) // self.chunk)
+
+    def dot(self, x):
+        '''
+        Get the returns of portfolio x in every scenario, without forming the scenarios
+
+        Args:
+            x: length N vector
+
+        Returns:
+            length S vector
+        '''
+        x = np.asarray(x, dtype = np.float64).reshape(-1)
+        returns = np.dot(self.r_hat, x) + np.dot(self.shocks, np.dot(self.L.T, x))
+        for j in range(self.num_chunks()):
+            start = j * self.chunk
+            returns[start:start + self.chunk] += np.dot(self.idiosyncratic(j), x)
+        return(returns)
+
+    def take(self, rows, axis = 0):
+        '''
+        Returns:
+            the scenarios of the given rows as a matrix, like ndarray.take
+        '''
+        if axis != 0:
+            raise ValueError('FactorScenarios can only take rows')
+        rows = np.asarray(rows)
+        taken = np.empty((rows.shape[0], self.shape[1]))
+        chunks = rows // self.chunk
+        for j in np.unique(chunks):
+            mine = np.flatnonzero(chunks == j)
+            taken[mine] = self.block(j)[rows[mine] - j * self.chunk]
+        return(taken)
+
+    def dense(self):
+        '''
+        Returns:
+            the S-by-N matrix of the scenarios
+        '''
+        return(np.vstack([self.block(j) for j in range(self.num_chunks())]))
+
+
+class ScenarioGenerator(object):
+    '''
+    Cached scenarios for one training window
+
+    Args:
+        r_hat: expected returns, N or N-by-1
+        sigma: N-by-N covariance
+        training_data: T-by-N returns the bootstrap resamples from
+        rng: optional np.random.Generator; by default the global np.random state is used
+        sampling: how the Gaussian scenarios are drawn, one of samplings (the
+                  bootstrap always draws plain Monte Carlo)
+        direction: weights of the portfolio whose loss the 'stratified'
+                   sampling stratifies, by default the equally weighted one
+                   (for a FactorCovariance, the factor part of the loss)
+        chunk: number of rows of factor model scenarios assembled at a time
+    '''
+
+    def __init__(self, r_hat, sigma, training_data = None, rng = None, sampling = 'mc', direction = None,
+                 chunk = 256):
+        if sampling not in samplings:
+            raise ValueError('unknown sampling %r, expected one of %s' % (sampling, ', '.join(samplings)))
+        self.r_hat = np.array(r_hat, dtype = np.float64).reshape(-1)
+        self.sigma = sigma
+        self.training_data = training_data
+        self.rng = rng
+        self.sampling = sampling
+        self.direction = direction
+        self.chunk = chunk
+        self.factor = None
+        self.cache = {}
+
+    def normal(self, size):
+        if self.rng is None:
+            return(np.random.standard_normal(size))
+        return(self.rng.standard_normal(size))
+
+    def integers(self, high, size):
+        if self.rng is None:
+            return(np.random.choice(high, size))
+        return(self.rng.integers(0, high, size))
+
+    def uniform(self, size):
+        if self.rng is None:
+            return(np.random.random_sample(size))
+        return(self.rng.random(size))
+
+    def standard_normal(self, num_sample):
+        '''
+        Returns:
+            num_sample-by-r standard normal draws z by the sampling method, for
+            the N-by-r factor L of sigma
+        '''
+        r = self.factor.shape[1]
+        if self.sampling == 'sobol':
+            seed = self.rng if self.rng is not None else np.random.randint(2 ** 31)
+            u = qmc.Sobol(r, scramble = True, seed = seed).random(num_sample)
+            # scrambled points are never 0, but can round to 1 - 2^-53
+            return(norm.ppf(np.clip(u, 2.0 ** -53, 1 - 2.0 ** -53)))
+        if self.sampling == 'antithetic':
+            z = self.normal(((num_sample + 1) // 2, r))
+            return(np.concatenate((z, -z))[:num_sample])
+        z = self.normal((num_sample, r))
+        if self.sampling == 'stratified':
+            # the loss of portfolio w moves along L' w in z
+            w = np.ones(self.factor.shape[0]) if self.direction is None else np.ravel(self.direction)
+            v = np.dot(w, self.factor)
+            v = v / np.linalg.norm(v)
+            strata = (np.argsort(self.uniform(num_sample)) + self.uniform(num_sample)) / num_sample
+            z = z + np.outer(norm.ppf(strata) - np.dot(z, v), v)
+        return(z)
+
+    def gaussian(self, num_sample):
+        '''
+        Returns:
+            num_sample-by-N draws from N(r_hat, sigma), the same matrix on every call
+        '''
+        key = ('gaussian', num_sample)
+        if key not in self.cache and isinstance(self.sigma, FactorCovariance):
+            self.cache[key] = self.factored(num_sample).dense()
+        if key not in self.cache:
+            if self.factor is None:
+                self.factor = covariance_factor(self.sigma)
+            z = self.standard_normal(num_sample)
+            self.cache[key] = self.r_hat + np.dot(z, self.factor.T)
+        return(self.cache[key])
+
+    def factored(self, num_sample):
+        '''
+        Returns:
+            FactorScenarios of num_sample draws from N(r_hat, sigma) for a
+            FactorCovariance sigma, the same scenarios as gaussian() and the
+            same on every call
+        '''
+        if not isinstance(self.sigma, FactorCovariance):
+            raise ValueError('factored scenarios need sigma as a FactorCovariance')
+        key = ('factored', num_sample)
+        if key not in self.cache:
+            self.factor = self.sigma.factor()
+            shocks = self.standard_normal(num_sample)
+            entropy = int(self.rng.integers(2 ** 63)) if self.rng is not None else np.random.randint(2 ** 31)
+            self.cache[key] = FactorScenarios(self.r_hat, self.factor, self.sigma.idio, shocks, entropy,
+                                              self.chunk)
+        return(self.cache[key])
+
+    def bootstrap(self, num_sample):
+        '''
+        Returns:
+            num_sample rows of training_data drawn with replacement, the same matrix on every call
+        '''
+        key = ('bootstrap', num_sample)
+        if key not in self.cache:
+            myindices = self.integers(self.training_data.shape[0], num_sample)
+            self.cache[key] = np.asarray(self.training_data)[myindices, :]
+        return(self.cache[key])
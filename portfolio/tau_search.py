@@ -0,0 +1,108 @@
+'''
+Adaptive search of the tau grid for the best admissible portfolio.
+
+The sweeps solve every tau of the 46-point grid and then keep only the
+admissible solutions (no shorts, at most 30 equities) to pick the one with
+the best selection criterion (smallest training sd, smallest CVaR, ...).
+Admissibility is (close to) monotone in tau, since a larger penalty gives a
+sparser, long-only portfolio, and along the admissible part the criterion
+gets worse as tau grows and the portfolio is pushed away from the
+unpenalised optimum (or stays put: once the portfolio is long-only,
+||x||_1 = 1 and a larger tau changes nothing).  search_tau() therefore brackets the smallest
+admissible tau with a few probes of the grid, bisects for it and then walks
+up from it while the criterion improves, solving about 6 - 10 of the 46
+problems.
+
+The search only ever picks a grid tau, so the result is the one the full
+scan would pick whenever those two monotonicity assumptions hold.
+
+Usage:
+    (best, solved) = search_tau(lambda tau: minimize_var(...), taus,
+                                admissible = lambda value, x: no_shorts(x) and cardinality(x) <= 30,
+                                score = lambda value, x: np.dot(x, np.dot(sigma, x)))
+'''
+
+import numpy as np
+
+
+def cardinality(x):
+    '''
+    Get the number of equities held (strictly positive weights)
+    '''
+    return(int(np.count_nonzero(np.asarray(x) > 0)))
+
+
+def no_shorts(x):
+    '''
+    Check that no weight is negative
+    '''
+    return(bool(np.all(np.asarray(x) >= 0)))
+
+
+def search_tau(solve, taus, admissible, score, patience = 2, probes = 4):
+    '''
+    Find the admissible solution with the smallest score over a grid of taus
+
+    Args:
+        solve: function of tau returning a tuple (optimal value, optimal x)
+        taus: the grid, in increasing order
+        admissible: function of (value, x), whether the solution may be chosen
+        score: function of (value, x), smaller is better
+        patience: stop walking up the grid after this many taus in a row
+                  that do not improve the score
+        probes: number of evenly spaced taus, from the largest down, tried to
+                find an admissible one before giving up; more than one guards
+                against a largest tau that is inadmissible only through
+                solver noise in the weights
+
+    Returns:
+        tuple of the index of the best tau (None if no solved tau is
+        admissible) and a dictionary from the index of every solved tau to
+        its (value, x)
+    '''
+    solved = {}
+
+    def get(i):
+        if i not in solved:
+            solved[i] = solve(taus[i])
+        return(solved[i])
+
+    def ok(i):
+        return(admissible(*get(i)))
+
+    n = len(taus)
+    # bracket: find an admissible tau, trying the largest first
+    grid = np.unique(np.linspace(n - 1, 0, num = min(probes, n)).round().astype(int))[::-1]
+    hi = None
+    for (k, i) in enumerate(grid):
+        if ok(i):
+            hi = i
+            break
+    if hi is None:
+        return(None, solved)
+    lo = grid[k + 1] if k + 1 < grid.shape[0] else -1
+    while lo >= 0 and ok(lo):
+        # an admissible probe below the first one, keep bracketing downwards
+        hi = lo
+        k += 1
+        lo = grid[k + 1] if k + 1 < grid.shape[0] else -1
+    # bisect for the smallest admissible tau, lo inadmissible and hi admissible
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if ok(mid):
+            hi = mid
+        else:
+            lo = mid
+    best = hi
+    best_score = score(*get(hi))
+    misses = 0
+    i = hi + 1
+    while i < n and misses < patience:
+        if ok(i) and score(*get(i)) < best_score:
+            best = i
+            best_score = score(*get(i))
+            misses = 0
+        else:
+            misses += 1
+        i += 1
+    return(best, solved)
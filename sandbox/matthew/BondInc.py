@@ -3,6 +3,11 @@ import pandas as pd
 import cvxpy as cvx
 import pandas_datareader.data as web
 import datetime
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from portfolio import aggregation
 
 #For initial Bond Data, we'll use 10 year Yields from data FRED(Federal Reserve Economic Data (St. Louis)).
 start = datetime.datetime(1991, 1, 1)
@@ -14,19 +19,17 @@ mon=pd.read_csv('monthlyreturnsNYSE1986.csv')
 
 mon.drop(mon.columns[[0]], axis=1, inplace=True)
 
-#rhat are the yearly returns, obtained from our monthly returns.
+#rhat are the yearly (gross) returns, obtained from our monthly returns.
 #Probably shouldn't be called rhat, as it isn't expected returns.
-rhat = (mon.ix[0:11,:]+1).apply(np.prod, axis=0)
-
-for i in range(1, 31):
-	test=(mon.ix[i*12:i*12+11,:]+1).apply(np.prod, axis=0)
-	rhat=np.vstack([rhat, test])
+rhat = aggregation.compound(mon.values, 12) + 1
+#rhat5[i]: the geometric mean of the yearly returns of years i to i+4.
+rhat5 = aggregation.rolling_geometric_mean(rhat, 5)
 
 #returns for equally weighting each stock starting in 1995 to 2016
 np.mean(np.cumprod(rhat[5:27],axis=0), axis=1)
 	
 #rhat1: Our expected yearly returns
-rhat1=np.power(np.prod(rhat[:5,:], axis=0),1./5)
+rhat1=rhat5[0]
 #sigma: initial covariance matrix
 sigma=np.cov(mon.ix[:59,:], rowvar=False)
 #The number of stocks.
@@ -71,7 +74,7 @@ xnew = np.append(xnew, Bondam)
 #Now we use a for loop to get our portfolio returns through 2016.
 for year in range(1992, 2017):
 	i = year - 1991
-	rhatc = np.power(np.prod(rhat[i:i+5,:], axis=0),1./5)
+	rhatc = rhat5[i]
 	sigmac = np.cov(mon.ix[12*i:12*(i+5)-1,:], rowvar=False)
 	sigmad=np.vstack((sigmac, np.zeros((1,N))))
 	sigmad=np.hstack((sigmad, np.zeros((N+1,1))))
@@ -2,6 +2,11 @@ import csv
 import numpy as np
 import cvxpy as cvx
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from portfolio import returns_store
 
 
 year_offset = 1986
@@ -15,11 +20,11 @@ def load_dataset():
        and each column for a given equity,
        in the example, 360(months) * 201(equities)
     '''
-    market_cap_yearly = np.genfromtxt ('market_cap_yearly.csv', delimiter=",")
-    ME_yearly = np.genfromtxt ('ME_yearly.csv', delimiter=",")
-    btm_yearly = np.genfromtxt ('btm_yearly.csv', delimiter=",")
-    compounded_return_yearly = np.genfromtxt ('compounded_return_yearly.csv', delimiter=",")
-    monthly_return = np.genfromtxt ('monthly_return.csv', delimiter=",")
+    market_cap_yearly = returns_store.load_dataset('market_cap_yearly.csv', start = '1986', freq = 'A')
+    ME_yearly = returns_store.load_dataset('ME_yearly.csv', start = '1986', freq = 'A')
+    btm_yearly = returns_store.load_dataset('btm_yearly.csv', start = '1986', freq = 'A')
+    compounded_return_yearly = returns_store.load_dataset('compounded_return_yearly.csv', start = '1986', freq = 'A')
+    monthly_return = returns_store.load_dataset('monthly_return.csv', start = '1986-01')
     # print(market_cap_yearly.shape)
     # print(ME_yearly.shape)
     # print(btm_yearly.shape)
@@ -1,12 +1,23 @@
 import csv
 import numpy as np
-import cvxpy as cvx
 import matplotlib.pyplot as plt
+import argparse
+import os
+import sys
+from multiprocessing import Pool
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from portfolio import returns_store
+from portfolio import parametric_policy
 
 
 year_offset = 1986
 year_end = 2016 
 year_start = 1991
+# years the utility of theta is measured over; with 4 the utility has no
+# maximum in any year of the data and every theta is 0, with 12 it has one
+# in most years from 2000 on (earlier years have fewer years of data)
+lookback_years = 12
 
 def load_dataset():
     '''
@@ -15,11 +26,11 @@ def load_dataset():
        and each column for a given equity,
        in the example, 360(months) * 201(equities)
     '''
-    market_cap_yearly = np.genfromtxt ('market_cap_yearly.csv', delimiter=",")
-    ME_yearly = np.genfromtxt ('ME_yearly.csv', delimiter=",")
-    btm_yearly = np.genfromtxt ('btm_yearly.csv', delimiter=",")
-    compounded_return_yearly = np.genfromtxt ('compounded_return_yearly.csv', delimiter=",")
-    monthly_return = np.genfromtxt ('monthly_return.csv', delimiter=",")
+    market_cap_yearly = returns_store.load_dataset('market_cap_yearly.csv', start = '1986', freq = 'A')
+    ME_yearly = returns_store.load_dataset('ME_yearly.csv', start = '1986', freq = 'A')
+    btm_yearly = returns_store.load_dataset('btm_yearly.csv', start = '1986', freq = 'A')
+    compounded_return_yearly = returns_store.load_dataset('compounded_return_yearly.csv', start = '1986', freq = 'A')
+    monthly_return = returns_store.load_dataset('monthly_return.csv', start = '1986-01')
     # print(market_cap_yearly.shape)
     # print(ME_yearly.shape)
     # print(btm_yearly.shape)
@@ -56,125 +67,37 @@ def calc_return(x, monthly_return, year = 1988):
 
     
 
-def max_utility(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly, monthly_return, year = 1991, gamma = 5):
+def fit_theta(ME_yearly, btm_yearly, compounded_return_yearly, monthly_return, year = 1991, gamma = 5, lookback = lookback_years, theta0 = None):
     '''
-       year is the last year of training, i.e. the year before running the portfolio
+       year is the last year of training, i.e. the year before running the portfolio,
+       theta maximizes the CRRA utility (risk aversion gamma) of the wealth
+       1 + sum(12 monthly returns) * X * theta of each of the lookback years
+       before it (fewer when the data starts later), X the characteristics
+       (ME, btm, compounded return) of the year, solved by Newton's method
+       (portfolio/parametric_policy.py) from theta0,
+       returns theta and the status of the solve
     '''
     N = ME_yearly.shape[1]
-    index1 = year - year_offset - 4
-    # 
-    ME1 = ME_yearly[index1, :]
-    ME1.shape = ((ME1.shape[0], 1))
-    btm1 = btm_yearly[index1, :]
-    btm1.shape = ((btm1.shape[0], 1))
-    compounded_return1 = compounded_return_yearly[index1, :]
-    compounded_return1.shape = ((compounded_return1.shape[0], 1))
-    index_month_start1 = (index1 + 1) * 12
-    index_month_end1 = (index1 + 2) * 12
-    monthly_return_new_year1 = monthly_return[index_month_start1:index_month_end1, :]
-    design_matrix1 = np.column_stack((ME1, btm1, compounded_return1))
-    x_equal1 = calc_equal_weight(market_cap_yearly, year = year - 4)
-    # 
-    index2 = year - year_offset - 3
-    ME2 = ME_yearly[index2, :]
-    ME2.shape = ((ME2.shape[0], 1))
-    btm2 = btm_yearly[index2, :]
-    btm2.shape = ((btm1.shape[0], 1))
-    compounded_return2 = compounded_return_yearly[index2, :]
-    compounded_return2.shape = ((compounded_return2.shape[0], 1))
-    index_month_start2 = (index2 + 1) * 12
-    index_month_end2 = (index2 + 2) * 12
-    monthly_return_new_year2 = monthly_return[index_month_start2:index_month_end2, :]
-    design_matrix2 = np.column_stack((ME2, btm2, compounded_return2))
-    x_equal2 = calc_equal_weight(market_cap_yearly, year = year - 3)
-    # 
-    index3 = year - year_offset - 2
-    ME3 = ME_yearly[index3, :]
-    ME3.shape = ((ME3.shape[0], 1))
-    btm3 = btm_yearly[index3, :]
-    btm3.shape = ((btm3.shape[0], 1))
-    compounded_return3 = compounded_return_yearly[index3, :]
-    compounded_return3.shape = ((compounded_return3.shape[0], 1))
-    index_month_start3 = (index3 + 1) * 12
-    index_month_end3 = (index3 + 2) * 12
-    monthly_return_new_year3 = monthly_return[index_month_start3:index_month_end3, :]
-    design_matrix3 = np.column_stack((ME3, btm3, compounded_return3))
-    x_equal3 = calc_equal_weight(market_cap_yearly, year = year - 2)
-    # 
-    index4 = year - year_offset - 1
-    ME4 = ME_yearly[index4, :]
-    ME4.shape = ((ME4.shape[0], 1))
-    btm4 = btm_yearly[index4, :]
-    btm4.shape = ((btm4.shape[0], 1))
-    compounded_return4 = compounded_return_yearly[index4, :]
-    compounded_return4.shape = ((compounded_return4.shape[0], 1))
-    index_month_start4 = (index4 + 1) * 12
-    index_month_end4 = (index4 + 2) * 12
-    monthly_return_new_year4 = monthly_return[index_month_start4:index_month_end4, :]
-    design_matrix4 = np.column_stack((ME4, btm4, compounded_return4))
-    x_equal4 = calc_equal_weight(market_cap_yearly, year = year - 1)
-    # 
-    index5 = year - year_offset
-    ME5 = ME_yearly[index5, :]
-    ME5.shape = ((ME5.shape[0], 1))
-    btm5 = btm_yearly[index5, :]
-    btm5.shape = ((btm5.shape[0], 1))
-    compounded_return5 = compounded_return_yearly[index5, :]
-    compounded_return5.shape = ((compounded_return5.shape[0], 1))
-    design_matrix5 = np.column_stack((ME5, btm5, compounded_return5))
-    x_equal5 = calc_equal_weight(market_cap_yearly, year = year)
-
-    # print(design_matrix.shape)
-    # print(market_cap.shape)
-    # print(ME.shape)
-    # print(btm.shape)
-    # print(compounded_return.shape)
-    # print(monthly_return_new_year.shape)
-    
-    one_12 = np.ones((1, 12))
-    one_N = np.ones((1, N))
-    # variable
-    tmp_matrix1 = np.dot( np.dot(one_12 ,monthly_return_new_year1), design_matrix1)
-    tmp_matrix2 = np.dot( np.dot(one_12 ,monthly_return_new_year2), design_matrix2)
-    tmp_matrix3 = np.dot( np.dot(one_12 ,monthly_return_new_year3), design_matrix3)
-    tmp_matrix4 = np.dot( np.dot(one_12 ,monthly_return_new_year4), design_matrix4)
-    theta = cvx.Variable(3)
-    # # constraints
-    constraints = [ 
-                     # x_equal1 + 1./N * design_matrix1 * theta <= 0.09,
-                     # x_equal1 + 1./N * design_matrix1 * theta >= -0.09,
-                     # x_equal2 + 1./N * design_matrix2 * theta <= 0.09,
-                     # x_equal2 + 1./N * design_matrix2 * theta >= -0.09,
-                     # x_equal3 + 1./N * design_matrix3 * theta <= 0.09,
-                     # x_equal3 + 1./N * design_matrix3 * theta >= -0.09,
-                     # x_equal4 + 1./N * design_matrix4 * theta <= 0.09,
-                     # x_equal4 + 1./N * design_matrix4 * theta >= -0.09,
-                     # x_equal5 + 1./N * design_matrix5 * theta <= 0.08,
-                     # x_equal5 + 1./N * design_matrix5 * theta >= -0.08,
-                     # theta >= -5.0,
-                     # theta <= 5.0
-                   ]
-    # # problem
-    #obj = cvx.Minimize( -tmp_matrix1 * theta -tmp_matrix2 * theta - tmp_matrix3 * theta -tmp_matrix4 * theta)
-    obj = cvx.Minimize( cvx.power(1 + tmp_matrix1 * theta, 1-gamma) +cvx.power(1 + tmp_matrix2 * theta, 1-gamma) +cvx.power(1 + tmp_matrix3 * theta, 1-gamma) +cvx.power(1 + tmp_matrix4 * theta, 1-gamma) )
-
-    prob = cvx.Problem(obj, constraints)
-    prob.solve() 
-    # # retrieve results 
-    optimal_theta = theta.value
-    # ignore the x's due to round-off error
-    #optimal_theta = np.around(optimal_theta, decimals = 4)
-    #optimal_theta =  optimal_x/sum(optimal_theta)
-    theta1 = np.zeros((3, 1))
-    # cheating here, do nothing if no optimal theta is found
-    theta1[0, 0] = 0.0 #
-    theta1[1, 0] = 0.0 #
-    theta1[2, 0] = 0.0 #
-    if optimal_theta is not None:
-        #print(optimal_theta.shape)
-        print(optimal_theta)
-        theta1 = optimal_theta
-    x_optimal = x_equal5 + 1./N * np.dot(design_matrix5 , theta1)
+    # the characteristics of the lookback years (L * N * K) and the monthly
+    # returns of the year after each of them (L * 12 * N)
+    indices = np.arange(max(year - year_offset - lookback, 0), year - year_offset)
+    characteristics = np.stack((ME_yearly[indices], btm_yearly[indices], compounded_return_yearly[indices]), axis = 2)
+    returns = monthly_return[(indices[0] + 1) * 12:(indices[-1] + 2) * 12, :].reshape((indices.shape[0], 12, N))
+    (a, c) = parametric_policy.policy_summaries(characteristics, returns)
+    return parametric_policy.crra_newton(a, c, gamma, theta0 = theta0)
+
+
+def policy_portfolio(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly, theta, year = 1991):
+    '''
+       the weights of the policy theta for the year after year: the value
+       weights of year tilted by its characteristics, without shorts
+    '''
+    N = ME_yearly.shape[1]
+    index = year - year_offset
+    characteristics = np.column_stack((ME_yearly[index, :], btm_yearly[index, :], compounded_return_yearly[index, :]))
+    x_equal = calc_equal_weight(market_cap_yearly, year = year)
+    x_optimal = parametric_policy.policy_weights(x_equal, characteristics, theta)
+    x_optimal.shape = (N, 1)
     # doesn't allow short here
     x_optimal[x_optimal < 0] = 0
     x_optimal = x_optimal/ sum(x_optimal)
@@ -182,11 +105,102 @@ def max_utility(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_year
     return x_optimal
 
 
+def max_utility(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly, monthly_return, year = 1991, gamma = 5, lookback = lookback_years):
+    '''
+       year is the last year of training, i.e. the year before running the portfolio,
+       the portfolio of the theta of fit_theta(), theta is 0 if the utility has no maximum
+    '''
+    (optimal_theta, status) = fit_theta(ME_yearly, btm_yearly, compounded_return_yearly, monthly_return,
+                                        year = year, gamma = gamma, lookback = lookback)
+    print(optimal_theta)
+    if status != 'optimal':
+        # do nothing if no optimal theta is found
+        print('no optimal theta (' + status + '), using theta = 0')
+        optimal_theta = np.zeros(optimal_theta.shape[0])
+    return policy_portfolio(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly, optimal_theta,
+                            year = year)
+
+
+def sweep_year(task):
+    '''
+       Solve every gamma of one year, the unit of work of the process pool,
+       task is (this_year, gammas, lookback, market_cap_yearly, ME_yearly,
+       btm_yearly, compounded_return_yearly, monthly_return),
+       the gammas are solved in increasing order, each theta from the
+       theta of the gamma before it (when that one had a maximum),
+       returns a list of (gamma, theta, status, x_optimal, return_optimal)
+       in the order of the sorted gammas
+    '''
+    (this_year, gammas, lookback, market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly,
+     monthly_return) = task
+    results = []
+    theta0 = None
+    for gamma in sorted(gammas):
+        (theta, status) = fit_theta(ME_yearly, btm_yearly, compounded_return_yearly, monthly_return,
+                                    year = this_year - 1, gamma = gamma, lookback = lookback, theta0 = theta0)
+        theta0 = theta if status == 'optimal' else None
+        if status != 'optimal':
+            theta = np.zeros(theta.shape[0])
+        x_optimal = policy_portfolio(market_cap_yearly, ME_yearly, btm_yearly, compounded_return_yearly, theta,
+                                     year = this_year - 1)
+        return_optimal = calc_return(x_optimal, monthly_return, year = this_year)
+        results.append((gamma, theta, status, np.ravel(x_optimal), np.ravel(return_optimal)))
+    return results
+
+
+def write_sweep(filename, results_year):
+    '''
+       write the results of sweep_year() for every year as one tidy table,
+       a row for each (gamma, year, quantity, name) with its value: the
+       thetas (named by characteristic), the weights (named by equity
+       index) and the 12 out-of-sample monthly returns (named by month),
+       along with the status of theta's solve
+    '''
+    names = ['ME', 'btm', 'compounded_return']
+    with open(filename, 'w', newline = '') as f:
+        writer = csv.writer(f)
+        writer.writerow(['gamma', 'year', 'status', 'quantity', 'name', 'value'])
+        for (this_year, results) in results_year:
+            for (gamma, theta, status, x_optimal, return_optimal) in results:
+                key = [repr(float(gamma)), this_year, status]
+                writer.writerows(key + ['theta', names[k], repr(float(theta[k]))] for k in range(theta.shape[0]))
+                writer.writerows(key + ['weight', int(i), repr(float(x_optimal[i]))] for i in np.flatnonzero(x_optimal))
+                writer.writerows(key + ['return', m + 1, repr(float(return_optimal[m]))] for m in range(return_optimal.shape[0]))
+
 
 
 if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gammas', type = float, nargs = '+', default = None,
+                        help = 'sweep these risk aversions over the years and write gamma_sweep.csv instead')
+    parser.add_argument('--lookback', type = int, default = lookback_years,
+                        help = 'number of years the utility of theta is measured over')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of processes solving the years of the sweep in parallel')
+    args = parser.parse_args()
  
     (mymarket_cap_yearly, myME_yearly, mybtm_yearly, mycompounded_return_yearly, mymonthly_return) = load_dataset() 
+    if args.gammas is not None:
+        # a task for each year, solving all its gammas
+        tasks = [(this_year, args.gammas, args.lookback, mymarket_cap_yearly, myME_yearly, mybtm_yearly,
+                  mycompounded_return_yearly, mymonthly_return) for this_year in range(year_start, year_end)]
+        if args.workers <= 1:
+            results = [sweep_year(task) for task in tasks]
+        else:
+            with Pool(args.workers) as pool:
+                results = pool.map(sweep_year, tasks, chunksize = 1)
+        write_sweep('gamma_sweep.csv', zip(range(year_start, year_end), results))
+        # a year whose utility has no maximum for any gamma has theta = 0 for all of them
+        degenerate = [this_year for (this_year, results_year) in zip(range(year_start, year_end), results)
+                      if all(status != 'optimal' for (gamma, theta, status, x, r) in results_year)]
+        if len(degenerate) == len(results):
+            print('warning: no gamma has an optimal theta in any year, every row of gamma_sweep.csv '
+                  'has theta = 0; try a longer --lookback')
+        elif degenerate:
+            print('warning: no gamma has an optimal theta in ' + ', '.join(str(y) for y in degenerate)
+                  + ', those years have theta = 0')
+        sys.exit(0)
     # 
     return_equal_yearly = np.zeros((12, year_end - year_start))
     return_optimal_yearly = np.zeros((12, year_end - year_start))
@@ -200,7 +214,7 @@ if __name__ == "__main__":
         myx_equal_value = calc_equal_weight(mymarket_cap_yearly, year = this_year - 1)
         myx_equal = calc_equal_naive()
         myx_optimal = max_utility(mymarket_cap_yearly, myME_yearly, mybtm_yearly,
-     mycompounded_return_yearly, mymonthly_return, year = this_year - 1, gamma = 5)
+     mycompounded_return_yearly, mymonthly_return, year = this_year - 1, gamma = 5, lookback = args.lookback)
 
     #print(myx_equal_value.shape)
     #print(sum(x_equal_1987))
@@ -3,7 +3,11 @@ import numpy as np
 import cvxpy as cvx
 import matplotlib.pyplot as plt
 import random as rd
-import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from portfolio import aggregation
 
 training_years = 5 # number of years used to estimate the expected return and covariance matrix
 test_years = 1 # number of years to keep the portfolio run
@@ -20,19 +24,14 @@ if __name__ == "__main__":
     monthly_return_equal_year = np.genfromtxt ('return_equal_yearly.csv', delimiter=",")
 
     # try to claculate the cumulative return from 1991 to 2015
-    gain_log_optimal = monthly_return_year + np.ones((monthly_return_year.shape[0], monthly_return_year.shape[1]))
-    gain_log_equal = monthly_return_equal_year + np.ones((monthly_return_equal_year.shape[0], monthly_return_equal_year.shape[1]))
-    f = np.vectorize(math.log)
-    g = np.vectorize(math.exp)
-    gain_log_optimal = f(gain_log_optimal)
-    gain_log_equal = f(gain_log_equal)
-    yearly_gain_optimal = g(gain_log_optimal.sum(axis = 0))
-    yearly_gain_equal = g(gain_log_equal.sum(axis = 0))
+    # the months of a year are the rows of its column
+    months = monthly_return_year.shape[0]
+    yearly_gain_optimal = aggregation.compound(monthly_return_year, months)[0] + 1
+    yearly_gain_equal = aggregation.compound(monthly_return_equal_year, months)[0] + 1
 
     # compute compounded return for each year
-    h = np.vectorize(math.pow)
-    compounded_return_optimal = h(yearly_gain_optimal, 1./12) - 1.
-    compounded_return_equal = h(yearly_gain_equal, 1./12) - 1.
+    compounded_return_optimal = aggregation.geometric_mean(monthly_return_year + 1) - 1.
+    compounded_return_equal = aggregation.geometric_mean(monthly_return_equal_year + 1) - 1.
     #print(compounded_return_optimal)
     #print(compounded_return_equal)
 
@@ -40,16 +39,12 @@ if __name__ == "__main__":
 
     #print(yearly_gain_optimal)
     #print(yearly_gain_equal)
-    yearly_gain_optimal_log = f(yearly_gain_optimal)
-    yearly_gain_equal_log = f(yearly_gain_equal)
-    net_value_optimal = g(np.cumsum(yearly_gain_optimal_log))
-    net_value_equal = g(np.cumsum(yearly_gain_equal_log))
-    print(net_value_equal)
-    print(net_value_optimal)
-    print(net_value_equal.shape)
-    print(net_value_optimal.shape)
-    net_value_optimal = np.append([1], net_value_optimal)
-    net_value_equal = np.append([1], net_value_equal)
+    net_value_optimal = aggregation.net_value(yearly_gain_optimal)
+    net_value_equal = aggregation.net_value(yearly_gain_equal)
+    print(net_value_equal[1:])
+    print(net_value_optimal[1:])
+    print(net_value_equal[1:].shape)
+    print(net_value_optimal[1:].shape)
 
 
     # plot the cumulative value 
@@ -66,24 +61,14 @@ if __name__ == "__main__":
     plt.close("all")
 
     # plot the cumulative value including a transaction cost of 15 per year
-    gain_log_optimal = monthly_return_year + np.ones((monthly_return_year.shape[0], monthly_return_year.shape[1]))
-    gain_log_equal = monthly_return_equal_year + np.ones((monthly_return_equal_year.shape[0], monthly_return_equal_year.shape[1]))
-    f = np.vectorize(math.log)
-    g = np.vectorize(math.exp)
-    gain_log_optimal = f(gain_log_optimal)
-    gain_log_equal = f(gain_log_equal)
-    yearly_gain_optimal = g(gain_log_optimal.sum(axis = 0)) - 0.01
-    yearly_gain_equal = g(gain_log_equal.sum(axis = 0))
-    yearly_gain_optimal_log = f(yearly_gain_optimal)
-    yearly_gain_equal_log = f(yearly_gain_equal)
-    net_value_optimal = g(np.cumsum(yearly_gain_optimal_log))
-    net_value_equal = g(np.cumsum(yearly_gain_equal_log))
-    print(net_value_equal)
-    print(net_value_optimal)
-    print(net_value_equal.shape)
-    print(net_value_optimal.shape)
-    net_value_optimal = np.append([1], net_value_optimal)
-    net_value_equal = np.append([1], net_value_equal)
+    yearly_gain_optimal = aggregation.compound(monthly_return_year, months)[0] + 1 - 0.01
+    yearly_gain_equal = aggregation.compound(monthly_return_equal_year, months)[0] + 1
+    net_value_optimal = aggregation.net_value(yearly_gain_optimal)
+    net_value_equal = aggregation.net_value(yearly_gain_equal)
+    print(net_value_equal[1:])
+    print(net_value_optimal[1:])
+    print(net_value_equal[1:].shape)
+    print(net_value_optimal[1:].shape)
 
     plt.plot(range(year_start - 1, year_end), net_value_optimal, label="3-factor model")
     plt.plot(range(year_start - 1, year_end), net_value_equal, label = "Equally distributed")
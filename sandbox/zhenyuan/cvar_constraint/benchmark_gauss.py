@@ -0,0 +1,45 @@
+import time
+import tracemalloc
+import numpy as np
+
+import cvar_constraint as cc
+from portfolio import cvar
+
+# compare minimize_CVaR with use_gauss = True, sampled vs closed form
+years = [1996, 2001, 2006, 2011]
+sample_sizes = [1000, 10000]
+myalpha = 0.99
+mytau = 1.0e-3
+
+
+def run(mytraining_data, mytest_data, myr_hat, mysigma, myequal_weight_mean, num_sample, analytic):
+    '''
+       solve once, returning the CVaR bound, the weights, the seconds taken
+       and the peak memory allocated through numpy/python in MB
+    '''
+    tracemalloc.start()
+    t = time.time()
+    (myoptimal_value, myoptimal_x) = cc.minimize_CVaR(mytraining_data, mytest_data, myalpha,
+     myr_hat.copy(), mysigma, mytau, myequal_weight_mean, num_sample = num_sample,
+     use_gauss = True, analytic = analytic)
+    seconds = time.time() - t
+    peak = tracemalloc.get_traced_memory()[1] / 1.0e6
+    tracemalloc.stop()
+    return (myoptimal_value, myoptimal_x, seconds, peak)
+
+
+if __name__ == "__main__":
+
+    np.random.seed(0)
+    mydata = cc.load_dataset()
+    print('year  method          time(s)  peak(MB)  gamma      exact CVaR of x')
+    for year in years:
+        (mytraining_data, mytest_data, myr_hat, mysigma) = cc.preprocessing(mydata, year)
+        (myequal_weight_mean, myequal_weight_sd) = cc.calc_equal_weight(mytraining_data)
+        for num_sample in sample_sizes + [None]:
+            analytic = num_sample is None
+            (gamma, x, seconds, peak) = run(mytraining_data, mytest_data, myr_hat, mysigma,
+             myequal_weight_mean, num_sample or 0, analytic)
+            name = 'analytic' if analytic else 'sampled ' + str(num_sample)
+            print('%d  %-14s  %7.3f  %8.1f  %.6f   %.6f' % (year, name, seconds, peak,
+                  float(gamma), cvar.gaussian_cvar(x, myr_hat, mysigma, myalpha)))
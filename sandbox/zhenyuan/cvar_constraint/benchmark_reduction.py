@@ -0,0 +1,53 @@
+import time
+import numpy as np
+
+import cvar_constraint as cc
+from portfolio import cvar
+from portfolio.scenarios import ScenarioGenerator, task_rng
+from portfolio.scenario_reduction import reduce_scenarios
+
+# compare the scenario LP on all num_sample scenarios with the LP on reduced
+# scenarios, and on a plain subsample of the same size; every solution is
+# scored by its CVaR over all the scenarios
+years = [1996, 2001, 2006, 2011]
+num_sample = 10000
+reduced_sizes = [250, 500, 1000]
+myalpha = 0.99
+mytau = 1.0e-3
+myseed = 0
+
+
+if __name__ == "__main__":
+
+    mydata = cc.load_dataset()
+    print('year  method        scenarios  time(s)  gamma      CVaR on all  excess')
+    for year in years:
+        (mytraining_data, mytest_data, myr_hat, mysigma) = cc.preprocessing(mydata, year)
+        (myequal_weight_mean, myequal_weight_sd) = cc.calc_equal_weight(mytraining_data)
+        myr_hat = np.ravel(myr_hat)
+        myrng = task_rng(myseed, year)
+        mysamples = ScenarioGenerator(myr_hat, mysigma, rng = myrng).gaussian(num_sample)
+        t = time.time()
+        (mygamma, myx) = cvar.minimize_cvar_cutting_plane(mysamples, myalpha, myr_hat, mytau, myequal_weight_mean)
+        seconds = time.time() - t
+        myoptimum = cvar.sample_cvar(-np.dot(mysamples, myx), myalpha)[0]
+        myequal_cvar = cvar.sample_cvar(-mysamples.mean(axis = 1), myalpha)[0]
+        print('%d  %-12s  %9d  %7.3f  %.6f   %.6f     %.2e' % (year, 'all', num_sample, seconds, mygamma,
+              myoptimum, 0.0))
+        for num_reduced in reduced_sizes:
+            for method in ['reduced', 'subsample']:
+                t = time.time()
+                if method == 'reduced':
+                    (samples, probabilities) = reduce_scenarios(mysamples, num_reduced, myalpha, rng = myrng)
+                    # the tail of the equally weighted portfolio is kept, so is its CVaR
+                    reduced_cvar = cvar.sample_cvar(-samples.mean(axis = 1), myalpha, probabilities)[0]
+                    assert abs(reduced_cvar - myequal_cvar) <= 1e-12 * max(1.0, abs(myequal_cvar))
+                else:
+                    samples = mysamples[myrng.choice(num_sample, num_reduced, replace = False)]
+                    probabilities = None
+                (gamma, x) = cvar.minimize_cvar_cutting_plane(samples, myalpha, myr_hat, mytau, myequal_weight_mean,
+                                                              probabilities = probabilities)
+                seconds = time.time() - t
+                full = cvar.sample_cvar(-np.dot(mysamples, x), myalpha)[0]
+                print('%d  %-12s  %9d  %7.3f  %.6f   %.6f     %.2e' % (year, method, num_reduced, seconds, gamma,
+                      full, (full - myoptimum) / myoptimum))
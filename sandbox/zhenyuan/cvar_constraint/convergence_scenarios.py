@@ -0,0 +1,56 @@
+import time
+import numpy as np
+
+import cvar_constraint as cc
+from portfolio import cvar
+from portfolio.scenarios import ScenarioGenerator, task_rng, samplings
+
+# CVaR error of each scenario sampling method against the number of scenarios,
+# measured against the closed form of the Gaussian the scenarios are drawn from;
+# 'stratified' stratifies the loss of the Gaussian-optimal portfolio
+years = [1996, 2006]
+sample_sizes = [256, 1024, 4096, 16384]
+repeats = 20
+myalpha = 0.99
+mytau = 1.0e-3
+myseed = 0
+
+
+def errors(scenarios_of, num_sample, x_exact, exact_cvar, exact_optimum, r_hat, sigma, equal_weight_mean):
+    '''
+       over the repeats, the rms relative error of the sampled CVaR of the
+       Gaussian-optimal x_exact, and the mean relative excess of the exact CVaR
+       of the sampled problem's solution over the Gaussian optimum
+    '''
+    estimate = np.zeros(repeats)
+    excess = np.zeros(repeats)
+    for k in range(repeats):
+        samples = scenarios_of(k).gaussian(num_sample)
+        estimate[k] = cvar.sample_cvar(-np.dot(samples, x_exact), myalpha)[0]
+        (gamma, x) = cvar.minimize_cvar_cutting_plane(samples, myalpha, r_hat, mytau, equal_weight_mean)
+        excess[k] = cvar.gaussian_cvar(x, r_hat, sigma, myalpha) + mytau - exact_optimum
+    return (np.sqrt(np.mean((estimate / exact_cvar - 1) ** 2)), np.mean(excess) / abs(exact_optimum))
+
+
+if __name__ == "__main__":
+
+    mydata = cc.load_dataset()
+    print('year  sampling     samples  rms error of CVaR(x*)  excess CVaR of solution  time(s)')
+    for year in years:
+        (mytraining_data, mytest_data, myr_hat, mysigma) = cc.preprocessing(mydata, year)
+        (myequal_weight_mean, myequal_weight_sd) = cc.calc_equal_weight(mytraining_data)
+        myr_hat = np.ravel(myr_hat)
+        # the solution of the problem the scenarios approximate, and its CVaR
+        (myoptimum, myx) = cvar.minimize_gaussian_cvar(myr_hat, mysigma, myalpha, mytau, myequal_weight_mean)
+        myx = np.maximum(myx, 0.0) / np.maximum(myx, 0.0).sum()
+        myexact_cvar = cvar.gaussian_cvar(myx, myr_hat, mysigma, myalpha)
+        myexact_optimum = myexact_cvar + mytau
+        for sampling in samplings:
+            for num_sample in sample_sizes:
+                t = time.time()
+                (rms, excess) = errors(lambda k: ScenarioGenerator(myr_hat, mysigma,
+                                        rng = task_rng(myseed, year, k), sampling = sampling, direction = myx),
+                                       num_sample, myx, myexact_cvar, myexact_optimum, myr_hat, mysigma,
+                                       myequal_weight_mean)
+                print('%d  %-11s  %7d  %21.2e  %23.2e  %7.2f' % (year, sampling, num_sample, rms, excess,
+                      (time.time() - t) / repeats))
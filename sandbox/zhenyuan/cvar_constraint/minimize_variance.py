@@ -2,12 +2,27 @@ import csv
 import numpy as np
 import cvxpy as cvx
 import matplotlib.pyplot as plt
+import argparse
+import os
+import sys
+from multiprocessing import Pool, shared_memory
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from portfolio import returns_store
+from portfolio.rolling_moments import RollingMoments
+from portfolio.estimate_cache import EstimateCache
+from portfolio.min_variance import MinVarianceProblem
+from portfolio.min_variance_path import MinVariancePath
+from portfolio.active_set import ActiveSetProblem
+from portfolio import tau_search
+from portfolio.factor_model import FactorCovariance, pca_covariance
 
 
 training_years = 5 # number of years used to estimate the expected return and covariance matrix
 test_years = 1 # number of years to keep the portfolio run
 year_start = 1991 # the first year to run the portfolio, 1991 because the data starts from 19860101
 year_end = 2016 # the last year to run the portfolio, not inclusive
+dataset_file = 'sp500_monthlyreturn_19860101_20160101_nonames.csv' # monthly returns, months * equities
 
 
 def load_dataset():
@@ -17,16 +32,19 @@ def load_dataset():
        and each column for a given equity,
        in the example, 360(months) * 201(equities)
     '''
-    mydata = np.genfromtxt ('sp500_monthlyreturn_19860101_20160101_nonames.csv', delimiter=",")
+    mydata = returns_store.load_dataset(dataset_file, start = '1986-01')
     return mydata
 
 
-def preprocessing(allReturns, Year):
+def preprocessing(allReturns, Year, moments = None, cache = None):
     ''' allReturns is a 360 * 201 matrix of all the returns from 19860101 to 20151231,
         Year is any year we want to keep the portfolio running,
         the previous 5 years is used to estimate the r_hat and Sigma,
-        1991 - 2015 is valid as input Year
-       
+        1991 - 2015 is valid as input Year,
+        moments is an optional RollingMoments over allReturns, which updates
+        r_hat and Sigma from the previous window instead of recomputing them,
+        cache is an optional EstimateCache for allReturns, which keeps r_hat and
+        Sigma on disk so other runs and strategies can reuse them
     '''
     training_start = 12 * (Year - year_start)
     training_end = training_years * 12 + 12 * (Year - year_start)
@@ -34,10 +52,22 @@ def preprocessing(allReturns, Year):
     test_end = training_end + test_years * 12
     training_data = allReturns[training_start:training_end,:]
     test_data = allReturns[test_start:test_end,:]
-    r_hat = np.transpose(training_data.mean(axis = 0))
-    r_hat.shape = (r_hat.shape[0], 1)  # N * 1
-    sigma = np.cov(np.transpose(training_data))
-    return (training_data, test_data, r_hat, sigma)
+    estimates = None
+    if cache is not None:
+        estimates = cache.get(training_start, training_end - training_start, 'sample')
+    if estimates is None:
+        if moments is None:
+            r_hat = np.transpose(training_data.mean(axis = 0))
+            r_hat.shape = (r_hat.shape[0], 1)  # N * 1
+            sigma = np.cov(np.transpose(training_data))
+        else:
+            moments.seek(training_start)
+            r_hat = moments.mean()  # N * 1
+            sigma = moments.cov()
+        estimates = {'r_hat': r_hat, 'sigma': sigma}
+        if cache is not None:
+            cache.put(training_start, training_end - training_start, 'sample', estimates)
+    return (training_data, test_data, estimates['r_hat'], estimates['sigma'])
 
 def calc_equal_weight(training_data): 
     '''
@@ -50,35 +80,161 @@ def calc_equal_weight(training_data):
     equal_weight_sd = np.std(train_equal_return)
     return (equal_weight_mean, equal_weight_sd)
 
-def minimize_var(training_data, test_data, r_hat, sigma, tau, equal_weight_return):
+def minimize_var(training_data, test_data, r_hat, sigma, tau, equal_weight_return, problem = None):
     '''
        Solve a min-variance optimization problem with l1-norm,
-       tau is a parameter
+       tau is a parameter,
+       sigma is a N * N matrix or a FactorCovariance,
+       problem is an optional MinVarianceProblem, which is compiled once and
+       only has its data swapped in, instead of building a new problem per tau,
+       or a MinVariancePath, which reads the solution off the regularisation path,
+       or an ActiveSetProblem, which solves it in NumPy without cvxpy
     '''
-    N = training_data.shape[1]
-    one_N = np.ones((1, N))
-    r_hat_T = np.transpose(r_hat)
-    # variable
-    x = cvx.Variable(N)
-    # constraints
-    constraints = [one_N * x == 1 ,
-                   r_hat_T * x >= equal_weight_return]
-    # problem
-    obj = cvx.Minimize( cvx.quad_form(x, sigma) + tau * cvx.norm(x, 1))
-    prob = cvx.Problem(obj, constraints)
-    prob.solve() 
-    # retrieve results 
-    optimal_value = prob.value
-    optimal_x = x.value
+    if problem is None:
+        N = training_data.shape[1]
+        one_N = np.ones((1, N))
+        r_hat_T = np.transpose(r_hat)
+        # variable
+        x = cvx.Variable(N)
+        # constraints
+        constraints = [one_N * x == 1 ,
+                       r_hat_T * x >= equal_weight_return]
+        # problem
+        if isinstance(sigma, FactorCovariance):
+            risk = sigma.risk(x)
+        else:
+            risk = cvx.quad_form(x, sigma)
+        obj = cvx.Minimize( risk + tau * cvx.norm(x, 1))
+        prob = cvx.Problem(obj, constraints)
+        prob.solve() 
+        # retrieve results 
+        optimal_value = prob.value
+        optimal_x = x.value
+    else:
+        problem.set_data(r_hat, sigma, equal_weight_return)
+        (optimal_value, optimal_x) = problem.solve(tau)
     # ignore the x's due to round-off error
     optimal_x = np.around(optimal_x, decimals = 4)
     optimal_x =  optimal_x/sum(optimal_x)
     return (optimal_value, optimal_x)
 
+def selection_admissible(value, x):
+    '''
+       whether a solution can be chosen for the year: no short
+    '''
+    return tau_search.no_shorts(x)
+
+def selection_score(x, r_hat, sigma):
+    '''
+       criterion the best tau is chosen by, smaller is better: minus the
+       training Sharpe ratio, mean / sd of the training returns of x
+    '''
+    sd = np.sqrt(max(np.dot(x, np.dot(sigma, x)), 0.0))
+    return - np.dot(r_hat[:, 0], x) / max(sd, 1e-16)
+
+def solve_taus(r_hat, sigma, taus, equal_weight_return, factors = 0, path = False, search = False,
+               active_set = False):
+    '''
+       Solve minimize_var for every tau of one year, in order, each solve
+       warm started from the previous tau,
+       with factors > 0 Sigma is replaced by its leading factors principal
+       components plus a diagonal, and the problem size is N * factors,
+       with path = True the whole regularisation path over [min(taus), max(taus)]
+       is followed once and every tau is read off it,
+       with active_set = True every tau is solved by the NumPy active-set
+       solver, warm started from the previous tau's active set,
+       with search = True only the taus tau_search.search_tau needs to find the
+       best admissible x are solved, and the other columns are NaN,
+       returns the N * N_tau matrix of optimal x's
+    '''
+    N = sigma.shape[0]
+    sample_sigma = sigma
+    if factors > 0:
+        sigma = pca_covariance(sigma, factors)
+    if path:
+        problem = MinVariancePath(N, taus.min(), taus.max())
+    elif active_set:
+        problem = ActiveSetProblem(N)
+    elif factors > 0:
+        problem = MinVarianceProblem(N, factors, diagonal = True)
+    else:
+        problem = MinVarianceProblem(N, training_years * 12 - 1)
+    if search:
+        x_optimal_tau = np.full((N, taus.shape[0]), np.nan)
+        (best, solved) = tau_search.search_tau(
+            lambda tau: minimize_var(None, None, r_hat, sigma, tau, equal_weight_return, problem = problem),
+            taus, selection_admissible, lambda value, x: selection_score(x, r_hat, sample_sigma))
+        for i in solved:
+            x_optimal_tau[:, i] = solved[i][1]
+        return x_optimal_tau
+    x_optimal_tau = np.zeros((N, taus.shape[0]))
+    for i in range(taus.shape[0]):
+        (myoptimal_value, myoptimal_x) = minimize_var(None, None, r_hat, sigma, taus[i],
+         equal_weight_return, problem = problem)
+        x_optimal_tau[:, i] = myoptimal_x
+    return x_optimal_tau
+
+# estimates of all years, attached from shared memory in each worker process
+worker_state = {}
+
+def init_worker(shm_name, shape):
+    shm = shared_memory.SharedMemory(name = shm_name)
+    worker_state['shm'] = shm
+    worker_state['estimates'] = np.ndarray(shape, dtype = np.float64, buffer = shm.buf)
+
+def solve_year(task):
+    (k, taus, equal_weight_return, factors, path, search, active_set) = task
+    estimates = worker_state['estimates'][k]
+    return solve_taus(estimates[:, :1], estimates[:, 1:], taus, equal_weight_return, factors, path, search,
+                      active_set)
+
+def sweep_years(estimates, equal_weight_return_year, taus, workers = 1, factors = 0, path = False, search = False,
+                active_set = False):
+    '''
+       Solve the (year, tau) grid,
+       estimates is a N_years * N * (N + 1) array, r_hat in the first column of
+       each year and Sigma in the rest,
+       with workers > 1 the years are spread over a process pool that reads
+       the estimates from shared memory; every year is solved by solve_taus
+       either way, so the result does not depend on the number of workers,
+       factors, path, search and active_set are passed on to solve_taus,
+       returns the N * N_tau * N_years array of optimal x's
+    '''
+    N_years = estimates.shape[0]
+    tasks = [(k, taus, equal_weight_return_year[k], factors, path, search, active_set) for k in range(N_years)]
+    if workers <= 1:
+        worker_state['estimates'] = estimates
+        results = [solve_year(task) for task in tasks]
+    else:
+        shm = shared_memory.SharedMemory(create = True, size = estimates.nbytes)
+        try:
+            np.ndarray(estimates.shape, dtype = np.float64, buffer = shm.buf)[:] = estimates
+            with Pool(workers, initializer = init_worker, initargs = (shm.name, estimates.shape)) as pool:
+                results = pool.map(solve_year, tasks, chunksize = 1)
+        finally:
+            shm.close()
+            shm.unlink()
+    return np.stack(results, axis = 2)
+
 
 if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of processes solving the years in parallel')
+    parser.add_argument('--factors', type = int, default = 0,
+                        help = 'solve with this many principal components of Sigma plus a diagonal, 0 for the full Sigma')
+    parser.add_argument('--path', action = 'store_true',
+                        help = 'follow the regularisation path over tau once per year instead of solving every tau')
+    parser.add_argument('--search', action = 'store_true',
+                        help = 'solve only the taus needed to find the best admissible portfolio of each year')
+    parser.add_argument('--active-set', action = 'store_true',
+                        help = 'solve every tau with the NumPy active-set solver instead of cvxpy')
+    args = parser.parse_args()
  
     mydata = load_dataset() 
+    mymoments = RollingMoments(mydata, training_years * 12)
+    mycache = EstimateCache(returns_store.source_digest(dataset_file), shape = mydata.shape)
     taus1 = np.linspace(1.0e-5, 1.0e-4, num = 10)
     taus2 = np.linspace(2.0e-4, 1.0e-3, num = 9)
     taus3 = np.linspace(2.0e-3, 1.0e-2, num = 9)
@@ -89,23 +245,32 @@ if __name__ == "__main__":
     N_tau = taus.shape[0] # 46
     N_years = year_end - year_start #25
 
-    # solve the problem for different years, and different taus
-    x_optimal_year_tau = np.zeros((N_equity, N_tau ,N_years)) # all years and all taus
     x_optimal_year = np.zeros((N_equity, N_years)) # each year with best tau
     tau_optimal_year = np.zeros((1, N_years))
     monthly_return_year = np.zeros((12, N_years))
     monthly_return_equal_year = np.zeros((12, N_years))
     num_assets = np.zeros((1, N_years))
+    # estimate r_hat and Sigma for every year
+    training_data_year = []
+    test_data_year = []
+    estimates_year = np.zeros((N_years, N_equity, N_equity + 1)) # r_hat, then Sigma
+    equal_weight_mean_year = np.zeros(N_years)
+    for year in range(year_start, year_end):
+        (mytraining_data, mytest_data, myr_hat, mysigma) = preprocessing(mydata, year, mymoments, mycache)
+        (myequal_weight_mean, myequal_weight_sd) = calc_equal_weight(mytraining_data)
+        training_data_year.append(mytraining_data)
+        test_data_year.append(mytest_data)
+        estimates_year[year - year_start, :, 0] = myr_hat[:, 0]
+        estimates_year[year - year_start, :, 1:] = mysigma
+        equal_weight_mean_year[year - year_start] = myequal_weight_mean
+    # solve the problem for different years, and different taus
+    x_optimal_year_tau = sweep_years(estimates_year, equal_weight_mean_year, taus, args.workers, args.factors, args.path, args.search,
+                                     args.active_set) # all years and all taus
     #
     for year in range(year_start, year_end):
         print ('current year is ' + str(year))
-        (mytraining_data, mytest_data, myr_hat, mysigma) = preprocessing(mydata, year)
-        (myequal_weight_mean, myequal_weight_sd) = calc_equal_weight(mytraining_data)
-        for i in range(N_tau):
-            (myoptimal_value, myoptimal_x) = minimize_var(mytraining_data, mytest_data, myr_hat
-            , mysigma, taus[i], myequal_weight_mean)
-            myoptimal_x.shape = (myoptimal_x.shape[0],)
-            x_optimal_year_tau[:,i ,year - year_start] = myoptimal_x
+        mytraining_data = training_data_year[year - year_start]
+        mytest_data = test_data_year[year - year_start]
         # uncomment the below lines to output the full results for each year    
         filename = 'minimize_variance_' + str(year) + '.csv'
         np.savetxt(filename, x_optimal_year_tau[:,:, year - year_start], delimiter=",")
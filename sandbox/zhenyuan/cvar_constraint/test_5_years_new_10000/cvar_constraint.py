@@ -2,12 +2,29 @@ import csv
 import numpy as np
 import cvxpy as cvx
 import matplotlib.pyplot as plt
+import argparse
+import os
+import sys
+from multiprocessing import Pool
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..'))
+from portfolio import returns_store
+from portfolio.rolling_moments import RollingMoments
+from portfolio.estimate_cache import EstimateCache
+from portfolio import cvar
+from portfolio.scenarios import ScenarioGenerator, task_rng, samplings
+from portfolio import factor_model
+from portfolio import tau_search
+from portfolio import invariance
 
 training_years = 5 # number of years used to estimate the expected return and covariance matrix
 test_years = 1 # number of years to keep the portfolio run
 year_start = 1996 # the first year to run the portfolio, 1991 because the data starts from 19860101
 year_offset = 1991
 year_end = 2016 # the last year to run the portfolio, not inclusive
+dataset_file = 'sp500_monthlyreturn_19860101_20160101_nonames.csv' # monthly returns, months * equities
+max_assets = 30 # the chosen portfolio holds at most this many equities
+num_sample = 10000 # scenarios drawn per year
 
 
 def load_dataset():
@@ -17,16 +34,19 @@ def load_dataset():
        and each column for a given equity,
        in the example, 360(months) * 201(equities)
     '''
-    mydata = np.genfromtxt ('sp500_monthlyreturn_19860101_20160101_nonames.csv', delimiter=",")
+    mydata = returns_store.load_dataset(dataset_file, start = '1986-01')
     return mydata
 
 
-def preprocessing(allReturns, Year):
+def preprocessing(allReturns, Year, moments = None, cache = None):
     ''' allReturns is a 360 * 201 matrix of all the returns from 19860101 to 20151231,
         Year is any year we want to keep the portfolio running,
         the previous 5 years is used to estimate the r_hat and Sigma,
-        1991 - 2015 is valid as input Year
-       
+        1991 - 2015 is valid as input Year,
+        moments is an optional RollingMoments over allReturns, which updates
+        r_hat and Sigma from the previous window instead of recomputing them,
+        cache is an optional EstimateCache for allReturns, which keeps r_hat and
+        Sigma on disk so other runs and strategies can reuse them
     '''
     training_start = 12 * (Year - year_offset)
     training_end = training_years * 12 + 12 * (Year - year_offset)
@@ -34,10 +54,33 @@ def preprocessing(allReturns, Year):
     test_end = training_end + test_years * 12
     training_data = allReturns[training_start:training_end,:]
     test_data = allReturns[test_start:test_end,:]
-    r_hat = np.transpose(training_data.mean(axis = 0))
-    r_hat.shape = (r_hat.shape[0], 1)  # N * 1
-    sigma = np.cov(np.transpose(training_data))
-    return (training_data, test_data, r_hat, sigma)
+    estimates = None
+    if cache is not None:
+        estimates = cache.get(training_start, training_end - training_start, 'sample')
+    if estimates is None:
+        if moments is None:
+            r_hat = np.transpose(training_data.mean(axis = 0))
+            r_hat.shape = (r_hat.shape[0], 1)  # N * 1
+            sigma = np.cov(np.transpose(training_data))
+        else:
+            moments.seek(training_start)
+            r_hat = moments.mean()  # N * 1
+            sigma = moments.cov()
+        estimates = {'r_hat': r_hat, 'sigma': sigma}
+        if cache is not None:
+            cache.put(training_start, training_end - training_start, 'sample', estimates)
+    return (training_data, test_data, estimates['r_hat'], estimates['sigma'])
+
+def factor_covariance(allFactors, training_data, Year):
+    '''
+       the covariance of the factor model of the training period of Year,
+       from the regression of training_data on allFactors, the monthly
+       Fama-French factors from 19860101 (see portfolio/factor_model.py),
+       kept as a FactorCovariance rather than as an N * N matrix
+    '''
+    training_start = 12 * (Year - year_offset)
+    training_end = training_years * 12 + 12 * (Year - year_offset)
+    return factor_model.regression_covariance(training_data, allFactors[training_start:training_end, :])
 
 def calc_equal_weight(training_data): 
     '''
@@ -50,43 +93,29 @@ def calc_equal_weight(training_data):
     equal_weight_sd = np.std(train_equal_return)
     return (equal_weight_mean, equal_weight_sd)
 
-def minimize_CVaR(training_data, test_data, alpha, r_hat, sigma, tau, equal_weight_return, num_sample = 10000, use_gauss = True):
+def CVaR_problem(samples, alpha, r_hat, equal_weight_return):
     '''
-       Solve a maximize_variance optimization problem with CVaR constraint
-       alpha is a parameter
-       gamma is a parameter (better calculate gamma based on equally distributed portfolio)
+       Build the scenario LP of minimize_CVaR for the given samples
+       (num_sample * N), with tau as a cvx.Parameter,
+       returns the problem, tau, x and gamma
     '''
-    N = training_data.shape[1]
-    sample_number = num_sample
+    (sample_number, N) = samples.shape
     one_N = np.ones((1, N))
-    one_sample_number = np.ones((1, sample_number))
-    r_hat_T = np.transpose(r_hat)
-    p = 1./sample_number # probability of scenario
-
-    # sample from a multi-vairate normal distribution or using bootstrapping
-    mean = r_hat
-    mean.shape = (mean.shape[0], )
-    if use_gauss:
-        samples = np.random.multivariate_normal(r_hat, sigma, sample_number)
-        #print samples.shape
-    else:
-        myindices = np.random.choice(training_data.shape[0], num_sample)
-        samples = np.zeros((num_sample, N))
-        for k in range(num_sample):
-            samples[k,:] = training_data[myindices[k],:]
-    # print(samples.shape)
+    r_hat_T = np.reshape(r_hat, (1, N))
+    p = np.ones((1, sample_number))/sample_number # probability of scenario
     # variable
     x = cvx.Variable(N)
     w = cvx.Variable() # auxiliary variable
     y = cvx.Variable(sample_number) # auxiliary variables
     gamma = cvx.Variable() # bound for CVaR
+    tau = cvx.Parameter(nonneg = True)
     # constraints
     constraints = [
-                   w + 1./(1 - alpha) * p * one_sample_number * y <= gamma,
+                   w + 1./(1 - alpha) * p @ y <= gamma,
                    y >= 0,
-                   - samples * x - w <= y,
-                   r_hat_T * x >= equal_weight_return,
-                   one_N * x == 1,
+                   - samples @ x - w <= y,
+                   r_hat_T @ x >= equal_weight_return,
+                   one_N @ x == 1,
                    gamma >= 0,
                    x >= 0
                    ]
@@ -94,21 +123,172 @@ def minimize_CVaR(training_data, test_data, alpha, r_hat, sigma, tau, equal_weig
     # obj = cvx.Minimize( cvx.quad_form(x, sigma) + tau * cvx.norm(x, 1))
     obj = cvx.Minimize( gamma  + tau * cvx.norm(x, 1))
     prob = cvx.Problem(obj, constraints)
+    return (prob, tau, x, gamma)
+
+def solve_CVaR_problem(samples, alpha, r_hat, tau, equal_weight_return):
+    '''
+       Solve the scenario LP of CVaR_problem for one alpha and tau,
+       returns the optimal value and x
+    '''
+    (prob, tau_param, x, gamma) = CVaR_problem(samples, alpha, r_hat, equal_weight_return)
+    tau_param.value = tau
     prob.solve() 
     # retrieve results 
-    optimal_value = gamma.value
-    optimal_x = x.value
-    # print(gamma.value)
+    return (gamma.value, x.value)
+
+def solve_alphas(solve, alpha):
+    '''
+       Call solve(a) for every confidence level a of alpha, a number or a vector,
+       returns the optimal value and x of solve(alpha) for a number, and the
+       vector of the optimal values and the N * len(alpha) matrix of the x's
+       for a vector
+    '''
+    if np.ndim(alpha) == 0:
+        return solve(alpha)
+    solutions = [solve(a) for a in alpha]
+    return (np.array([value for (value, x) in solutions]), np.column_stack([np.ravel(x) for (value, x) in solutions]))
+
+def minimize_CVaR(training_data, test_data, alpha, r_hat, sigma, tau, equal_weight_return, num_sample = 10000, use_gauss = True, analytic = False, cutting_plane = False, scenarios = None, factored = False):
+    '''
+       Solve a maximize_variance optimization problem with CVaR constraint
+       alpha is a parameter, a number or a vector of confidence levels, which
+       are all solved on the same samples (the optimal values and x's then come
+       back as a vector and an N * len(alpha) matrix),
+       gamma is a parameter (better calculate gamma based on equally distributed portfolio)
+       with use_gauss and analytic, the CVaR of the Gaussian is used in closed
+       form (a small SOCP) instead of being estimated from num_sample scenarios,
+       with cutting_plane, the scenario problem is solved by cutting planes over
+       the tail scenarios instead of as one LP with num_sample auxiliary variables,
+       scenarios is an optional ScenarioGenerator for this year, which factors
+       sigma once and hands every tau the same samples,
+       with factored (and cutting_plane), the scenarios of a factor model sigma
+       are handed to the cutting planes in factored form, so the
+       num_sample * N matrix is never formed
+    '''
+    if use_gauss and analytic:
+        (optimal_value, optimal_x) = solve_alphas(
+            lambda a: cvar.minimize_gaussian_cvar(r_hat, sigma, a, tau, equal_weight_return), alpha)
+        # ignore the x's due to round-off error
+        optimal_x = np.around(optimal_x, decimals = 4)
+        optimal_x =  optimal_x/sum(optimal_x)
+        return (optimal_value, optimal_x)
+    sample_number = num_sample
+
+    # sample from a multi-vairate normal distribution or using bootstrapping
+    mean = r_hat
+    mean.shape = (mean.shape[0], )
+    if scenarios is not None and factored and use_gauss and cutting_plane:
+        samples = scenarios.factored(sample_number)
+    elif scenarios is not None:
+        samples = scenarios.gaussian(sample_number) if use_gauss else scenarios.bootstrap(num_sample)
+    elif use_gauss:
+        samples = np.random.multivariate_normal(r_hat, sigma, sample_number)
+        #print samples.shape
+    else:
+        myindices = np.random.choice(training_data.shape[0], num_sample)
+        samples = training_data[myindices, :]
+    # print(samples.shape)
+    if cutting_plane and np.ndim(alpha) > 0:
+        # each alpha starts from the working set and the losses of the one before
+        (optimal_value, optimal_x) = cvar.minimize_cvar_cutting_plane_alphas(samples, alpha, r_hat, tau,
+                                                                             equal_weight_return)
+    elif cutting_plane:
+        (optimal_value, optimal_x) = cvar.minimize_cvar_cutting_plane(samples, alpha, r_hat, tau, equal_weight_return)
+    else:
+        (optimal_value, optimal_x) = solve_alphas(
+            lambda a: solve_CVaR_problem(samples, a, r_hat, tau, equal_weight_return), alpha)
     # ignore the x's due to round-off error
     optimal_x = np.around(optimal_x, decimals = 4)
     optimal_x =  optimal_x/sum(optimal_x)
     return (optimal_value, optimal_x)
 
 
+def selection_admissible(value, x):
+    '''
+       whether a solution can be chosen for the year: no short and at
+       most max_assets equities
+    '''
+    return tau_search.no_shorts(x) and tau_search.cardinality(x) <= max_assets
+
+def solve_year(task):
+    '''
+       Solve every tau of one year, the unit of work of the process pool,
+       task is (k, training_data, test_data, r_hat, sigma, equal_weight_mean,
+       taus, alphas, seed, collapse_tau, search, sampling, num_sample,
+       factored),
+       sigma is the N * N covariance or the FactorCovariance of the year,
+       the num_sample scenarios of year k are drawn by the sampling method
+       from the stream task_rng(seed, k) of the run, and every alpha of alphas
+       is solved on them, so the
+       result does not depend on the worker that solves the year, nor on the
+       number of workers,
+       returns the N * N_tau * N_alpha array of optimal x's (NaN for the taus the
+       search skipped) and the N_tau * N_alpha optimal values
+    '''
+    (k, training_data, test_data, r_hat, sigma, equal_weight_mean, taus, alphas, seed,
+     collapse_tau, search, sampling, num_sample, factored) = task
+    N_tau = taus.shape[0]
+    N_alpha = alphas.shape[0]
+    x_optimal_tau = np.zeros((training_data.shape[1], N_tau, N_alpha))
+    optimal_value_tau = np.zeros((N_tau, N_alpha))
+    scenarios = ScenarioGenerator(r_hat, sigma, training_data, rng = task_rng(seed, k), sampling = sampling)
+    solve = lambda tau, alpha = alphas: minimize_CVaR(training_data, test_data, alpha, r_hat, sigma, tau,
+                                                      equal_weight_mean, num_sample = num_sample, use_gauss = True,
+                                                      cutting_plane = True, scenarios = scenarios,
+                                                      factored = factored)
+    if collapse_tau:
+        # solve once and use the solution for every tau
+        (optimal_value, optimal_x) = solve(taus[0])
+        x_optimal_tau[:, :, :] = optimal_x[:, np.newaxis, :]
+        optimal_value_tau[:, :] = optimal_value
+    elif search:
+        # only the solved taus are filled in, the scan of the taus skips the NaN ones;
+        # the search of every alpha visits its own taus, on the same scenarios
+        x_optimal_tau[:, :, :] = np.nan
+        optimal_value_tau[:, :] = np.nan
+        for a in range(N_alpha):
+            (tau_best_index, solved) = tau_search.search_tau(lambda tau: solve(tau, alphas[a]), taus,
+                                                             selection_admissible, lambda value, x: value)
+            for i in solved:
+                x_optimal_tau[:, i, a] = np.ravel(solved[i][1])
+                optimal_value_tau[i, a] = solved[i][0]
+    else:
+        for i in range(N_tau):
+            (optimal_value, optimal_x) = solve(taus[i])
+            x_optimal_tau[:, i, :] = optimal_x
+            optimal_value_tau[i, :] = optimal_value
+    return (x_optimal_tau, optimal_value_tau)
+
+
 if __name__ == "__main__":
   
-    myalpha = 0.99
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--search', action = 'store_true',
+                        help = 'solve only the taus needed to find the admissible portfolio with the smallest CVaR of each year')
+    parser.add_argument('--no-collapse', action = 'store_true',
+                        help = 'solve every tau even when tau cannot change the solution')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of processes solving the years in parallel')
+    parser.add_argument('--seed', type = int, default = None,
+                        help = 'seed of the scenarios, the results of a seed do not depend on --workers')
+    parser.add_argument('--sampling', choices = samplings, default = 'mc',
+                        help = 'how the Gaussian scenarios are drawn (see portfolio/scenarios.py)')
+    parser.add_argument('--num-sample', type = int, default = num_sample,
+                        help = 'number of scenarios drawn per year')
+    parser.add_argument('--factors', type = int, choices = [0, 3, 5], default = 0,
+                        help = 'draw the scenarios from the 3 or 5 factor Fama-French model of each year, 0 for the sample covariance')
+    parser.add_argument('--factored', action = 'store_true',
+                        help = 'keep the factor model scenarios in factored form for the LP (with --factors)')
+    parser.add_argument('--alphas', type = float, nargs = '+', default = [0.99],
+                        help = 'confidence levels of the CVaR, all solved on the same scenarios')
+    args = parser.parse_args()
+    if args.factored and args.factors == 0:
+        parser.error('--factored needs --factors 3 or --factors 5')
+
+    myalphas = np.array(args.alphas)
     mydata = load_dataset() 
+    mymoments = RollingMoments(mydata, training_years * 12)
+    mycache = EstimateCache(returns_store.source_digest(dataset_file), shape = mydata.shape)
     taus1 = np.linspace(1.0e-5, 1.0e-4, num = 10)
     taus2 = np.linspace(2.0e-4, 1.0e-3, num = 9)
     taus3 = np.linspace(2.0e-3, 1.0e-2, num = 9)
@@ -118,104 +298,124 @@ if __name__ == "__main__":
     N_equity = mydata.shape[1] # 201
     N_tau = taus.shape[0] # 46
     N_years = year_end - year_start #25
+    N_alpha = myalphas.shape[0]
+    # tau only scales ||x||_1, which x >= 0 and sum(x) == 1 fix at 1, so every tau
+    # has the same solution; the structure of the problem does not depend on the data.
+    # solve_year solves by cutting planes (cvar.cutting_plane), not this LP, but every
+    # round of cuts is this LP on the working-set scenarios, with the same constraints
+    # on x and ||x||_1 written as 1' x, so tau adds the constant tau to each of them
+    # and the check carries over; a one-scenario working set is what is checked here
+    (myproblem, mytau) = CVaR_problem(np.zeros((1, N_equity)), myalphas[0], np.zeros(N_equity), 0)[:2]
+    collapse_tau = invariance.is_invariant(myproblem, mytau) and not args.no_collapse
+    myseed = np.random.SeedSequence(args.seed).entropy
+    if args.factors > 0:
+        (myfactors, myfactor_names) = factor_model.read_factors(
+            factor_model.FF3_FILE if args.factors == 3 else factor_model.FF5_FILE)
+    print ('scenario seed is ' + str(myseed))
 
     # solve the problem for different years, and different taus
-    x_optimal_year_tau = np.zeros((N_equity, N_tau ,N_years)) # all years and all taus
-    x_optimal_year = np.zeros((N_equity, N_years)) # each year with best tau
-    tau_optimal_year = np.zeros((1, N_years))
-    monthly_return_year = np.zeros((12, N_years))
+    x_optimal_year_tau = np.zeros((N_equity, N_tau ,N_years, N_alpha)) # all years, all taus and all alphas
+    x_optimal_year = np.zeros((N_equity, N_years, N_alpha)) # each year and alpha with best tau
+    tau_optimal_year = np.zeros((N_alpha, N_years))
+    monthly_return_year = np.zeros((12, N_years, N_alpha))
     monthly_return_equal_year = np.zeros((12, N_years))
-    myoptimal_value_year_tau = np.zeros((1, N_tau ,N_years)) # all years and all taus
-    myoptimal_value_year = np.zeros((1 ,N_years)) # all years and all taus
-    num_assets = np.zeros((1, N_years))
+    myoptimal_value_year_tau = np.zeros((N_alpha, N_tau ,N_years)) # all years and all taus
+    myoptimal_value_year = np.zeros((N_alpha ,N_years)) # all years and all taus
+    num_assets = np.zeros((N_alpha, N_years))
+    # solve the problem for every year, each from its own stream of scenarios
+    training_data_year = []
+    test_data_year = []
+    tasks = []
+    for year in range(year_start, year_end):
+        (mytraining_data, mytest_data, myr_hat, mysigma) = preprocessing(mydata, year, mymoments, mycache)
+        (myequal_weight_mean, myequal_weight_sd) = calc_equal_weight(mytraining_data)
+        if args.factors > 0:
+            mysigma = factor_covariance(myfactors, mytraining_data, year)
+        training_data_year.append(mytraining_data)
+        test_data_year.append(mytest_data)
+        tasks.append((year - year_start, mytraining_data, mytest_data, myr_hat, mysigma, myequal_weight_mean,
+                      taus, myalphas, myseed, collapse_tau, args.search, args.sampling, args.num_sample,
+                      args.factored))
+    if args.workers <= 1:
+        results = [solve_year(task) for task in tasks]
+    else:
+        with Pool(args.workers) as pool:
+            results = pool.map(solve_year, tasks, chunksize = 1)
+    for (k, (myx_optimal_tau, myoptimal_value_tau)) in enumerate(results):
+        x_optimal_year_tau[:, :, k, :] = myx_optimal_tau
+        myoptimal_value_year_tau[:, :, k] = myoptimal_value_tau.T
     #
     for year in range(year_start, year_end):
         print ('current year is ' + str(year))
-        (mytraining_data, mytest_data, myr_hat, mysigma) = preprocessing(mydata, year)
-        (myequal_weight_mean, myequal_weight_sd) = calc_equal_weight(mytraining_data)
-        for i in range(N_tau):
-            (myoptimal_value, myoptimal_x) = minimize_CVaR(mytraining_data,
-             mytest_data, myalpha, myr_hat, mysigma, taus[i], myequal_weight_mean,
-             num_sample = 10000, use_gauss = True)
-            myoptimal_x.shape = (myoptimal_x.shape[0],)
-            x_optimal_year_tau[:,i ,year - year_start] = myoptimal_x
-            myoptimal_value_year_tau[:,i ,year - year_start] = myoptimal_value
+        mytraining_data = training_data_year[year - year_start]
+        mytest_data = test_data_year[year - year_start]
         # uncomment the below lines to output the full results for each year    
         #filename = 'minimize_CVaR_' + str(year) + '.csv'
         #np.savetxt(filename, x_optimal_year_tau[:,:, year - year_start], delimiter=",")
         
-        # choose from different taus the optimal model (cVaR)
-        tau_optimal_index = 0
-
-        # choose the model by the largest Sharpe ratio
-        # sr_optimal = -9999
-        # for i in range(N_tau):
-        #     tmp = x_optimal_year_tau[:,i ,year - year_start]
-        #     tmp2 = tmp[tmp >= 0]
-        #     if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
-        #         tmp_return = np.dot(mytraining_data, tmp)
-        #         tmp_return_mean = np.mean(tmp_return)
-        #         tmp_return_sd = np.std(tmp_return)
-        #         sr = tmp_return_mean/max(tmp_return_sd, 1e-16)
-        #         if sr > sr_optimal:
-        #             tau_optimal_index = i
-        #             sr_optimal = sr
-
-        # choose the model by the smallest training variance
-        # var_optimal = 9999
-        # for i in range(N_tau):
-        #     tmp = x_optimal_year_tau[:,i ,year - year_start]
-        #     tmp2 = tmp[tmp >= 0]
-        #     if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
-        #         tmp_return = np.dot(mytraining_data, tmp)
-        #         tmp_return_mean = np.mean(tmp_return)
-        #         tmp_return_sd = np.std(tmp_return)
-        #         if tmp_return_sd < var_optimal:
-        #             tau_optimal_index = i
-        #             var_optimal = tmp_return_sd
-
-        # choose the model by the smallest CVaR
-        cvar_optimal = 9999
-        for i in range(N_tau):
-            tmp = x_optimal_year_tau[:,i ,year - year_start]
-            tmp2 = tmp[tmp >= 0]
-            x_optim = x_optimal_year_tau[:,i ,year - year_start]
-            x_optim = x_optim[x_optim > 0]
-            tmp_num_assets = x_optim.shape[0]
-            if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
-                if (tmp_num_assets <= 30):
-                    tmp_cvar = myoptimal_value_year_tau[:,i ,year - year_start]
-                    if tmp_cvar < cvar_optimal:
-                        tau_optimal_index = i
-                        cvar_optimal = tmp_cvar
-
-        x_optimal_year[:, year - year_start] = x_optimal_year_tau[:,tau_optimal_index ,year - year_start]
-        x_optim = x_optimal_year[:, year - year_start]
-        x_optim = x_optim[x_optim > 0]
-        num_assets[0,year - year_start] = x_optim.shape[0]
-        tau_optimal_year[0,year - year_start] = taus[tau_optimal_index]
-        monthly_return_year[:, year - year_start] = np.dot(mytest_data, x_optimal_year[:, year - year_start])
         monthly_return_equal_year[:, year - year_start] = mytest_data.mean(axis = 1)
-        myoptimal_value_year[:, year - year_start] =  myoptimal_value_year_tau[:,tau_optimal_index ,year - year_start]
-    np.savetxt('myoptimal_value_year.csv', myoptimal_value_year, delimiter=",")
-    np.savetxt('num_assets.csv', num_assets, delimiter=",")
-    np.savetxt('x_optimal_year.csv', x_optimal_year, delimiter=",")
-    np.savetxt('monthly_return_year.csv', monthly_return_year, delimiter=",")
-    np.savetxt('tau_optimal_year.csv', tau_optimal_year, delimiter=",")
-    np.savetxt('monthly_return_equal_year.csv', monthly_return_equal_year, delimiter=",")
-
-    
-
-
-    
-    
-
-
-
-
-
-
+        # choose from different taus the optimal model (cVaR), for every alpha
+        for a in range(N_alpha):
+            tau_optimal_index = 0
 
+            # choose the model by the largest Sharpe ratio
+            # sr_optimal = -9999
+            # for i in range(N_tau):
+            #     tmp = x_optimal_year_tau[:,i ,year - year_start, a]
+            #     tmp2 = tmp[tmp >= 0]
+            #     if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
+            #         tmp_return = np.dot(mytraining_data, tmp)
+            #         tmp_return_mean = np.mean(tmp_return)
+            #         tmp_return_sd = np.std(tmp_return)
+            #         sr = tmp_return_mean/max(tmp_return_sd, 1e-16)
+            #         if sr > sr_optimal:
+            #             tau_optimal_index = i
+            #             sr_optimal = sr
 
+            # choose the model by the smallest training variance
+            # var_optimal = 9999
+            # for i in range(N_tau):
+            #     tmp = x_optimal_year_tau[:,i ,year - year_start, a]
+            #     tmp2 = tmp[tmp >= 0]
+            #     if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
+            #         tmp_return = np.dot(mytraining_data, tmp)
+            #         tmp_return_mean = np.mean(tmp_return)
+            #         tmp_return_sd = np.std(tmp_return)
+            #         if tmp_return_sd < var_optimal:
+            #             tau_optimal_index = i
+            #             var_optimal = tmp_return_sd
 
+            # choose the model by the smallest CVaR
+            cvar_optimal = 9999
+            for i in range(N_tau):
+                tmp = x_optimal_year_tau[:,i ,year - year_start, a]
+                tmp2 = tmp[tmp >= 0]
+                x_optim = x_optimal_year_tau[:,i ,year - year_start, a]
+                x_optim = x_optim[x_optim > 0]
+                tmp_num_assets = x_optim.shape[0]
+                if (tmp2.shape[0] == tmp.shape[0]):   # no short(all elements >= 0) 
+                    if (tmp_num_assets <= max_assets):
+                        tmp_cvar = myoptimal_value_year_tau[a,i ,year - year_start]
+                        if tmp_cvar < cvar_optimal:
+                            tau_optimal_index = i
+                            cvar_optimal = tmp_cvar
 
+            x_optimal_year[:, year - year_start, a] = x_optimal_year_tau[:,tau_optimal_index ,year - year_start, a]
+            x_optim = x_optimal_year[:, year - year_start, a]
+            x_optim = x_optim[x_optim > 0]
+            num_assets[a,year - year_start] = x_optim.shape[0]
+            tau_optimal_year[a,year - year_start] = taus[tau_optimal_index]
+            monthly_return_year[:, year - year_start, a] = np.dot(mytest_data, x_optimal_year[:, year - year_start, a])
+            myoptimal_value_year[a, year - year_start] =  myoptimal_value_year_tau[a,tau_optimal_index ,year - year_start]
+    for a in range(N_alpha):
+        # the first alpha keeps the file names post_processing.py reads
+        suffix = '' if a == 0 else '_alpha' + str(myalphas[a])
+        np.savetxt('myoptimal_value_year' + suffix + '.csv', myoptimal_value_year[a:a + 1, :], delimiter=",")
+        np.savetxt('num_assets' + suffix + '.csv', num_assets[a:a + 1, :], delimiter=",")
+        np.savetxt('x_optimal_year' + suffix + '.csv', x_optimal_year[:, :, a], delimiter=",")
+        np.savetxt('monthly_return_year' + suffix + '.csv', monthly_return_year[:, :, a], delimiter=",")
+        np.savetxt('tau_optimal_year' + suffix + '.csv', tau_optimal_year[a:a + 1, :], delimiter=",")
+    np.savetxt('monthly_return_equal_year.csv', monthly_return_equal_year, delimiter=",")
+    if N_alpha > 1:
+        # the alpha * year table of the optimal CVaRs, a row for each of --alphas
+        np.savetxt('myoptimal_value_alpha_year.csv', myoptimal_value_year, delimiter=",")